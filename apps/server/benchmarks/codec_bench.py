@@ -0,0 +1,77 @@
+"""
+Encode and decode cost per websocket message for each codec.
+
+Run from apps/server: python benchmarks/codec_bench.py [iterations]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec as wire
+from connection import Action, Event
+
+FAVORITES = [
+    (f"Station {i}", f"FV:2/{i}", "Radio station", f"http://192.168.1.20:1400/getaa?s=1&u=x-sonosapi-stream%3As{i}")
+    for i in range(120)
+]
+
+EVENTS = {
+    "volume": Event(type="volume", data=42, seq=1),
+    "track": Event(
+        type="play",
+        data={"track_info": {"title": "Song", "artist": "Artist", "album_art": "http://192.168.1.20:1400/getaa?u=x"}},
+        seq=2,
+    ),
+    "batch": Event(
+        type="batch",
+        data=[Event(type="volume", data=42), Event(type="playback-state", data={"isPlaying": True})],
+        seq=3,
+    ),
+    "favorites": Event(type="favorites", data={"version": 4, "hash": "0123456789abcdef", "items": FAVORITES}, seq=4),
+}
+
+ACTION = Action(type="volume", data={"volume": 42})
+
+
+def legacy_encode(event: Event) -> str:
+    """The serialization used before codecs: dict() followed by json.dumps"""
+    return json.dumps(event.model_dump())
+
+
+def per_call_us(func, iterations: int) -> float:
+    return timeit.timeit(func, number=iterations) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    codecs = [wire.get_codec("json"), wire.get_codec("json", deflate=True)]
+    if wire.is_msgpack_available():
+        codecs += [wire.get_codec("msgpack"), wire.get_codec("msgpack", deflate=True)]
+    else:
+        print("msgpack is not installed, skipping it")
+
+    print(f"{'message':<11} {'codec':<16} {'bytes':>7} {'encode us':>10}")
+    for name, event in EVENTS.items():
+        payload = legacy_encode(event)
+        print(f"{name:<11} {'legacy':<16} {len(payload):>7} {per_call_us(lambda: legacy_encode(event), iterations):>10.2f}")
+        for codec in codecs:
+            payload = codec.encode(event)
+            cost = per_call_us(lambda: codec.encode(event), iterations)
+            print(f"{name:<11} {codec.name:<16} {len(payload):>7} {cost:>10.2f}")
+
+    print()
+    print(f"{'action':<11} {'codec':<16} {'bytes':>7} {'decode us':>10}")
+    message = ACTION.model_dump_json()
+    legacy = per_call_us(lambda: Action(**json.loads(message)), iterations)
+    print(f"{'volume':<11} {'legacy':<16} {len(message):>7} {legacy:>10.2f}")
+    for codec in codecs:
+        payload = codec.inner.encode(ACTION) if isinstance(codec, wire.DeflateCodec) else codec.encode(ACTION)
+        cost = per_call_us(lambda: codec.decode(payload, Action), iterations)
+        print(f"{'volume':<11} {codec.name:<16} {len(payload):>7} {cost:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
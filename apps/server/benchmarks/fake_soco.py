@@ -0,0 +1,182 @@
+"""
+In-process stand-in for a Sonos speaker, for benchmarks. It implements the parts of
+SoCo the server touches, answers with a configurable SOAP delay, and delivers GENA
+events through the same subscription callbacks the real event listener would use.
+"""
+import asyncio
+import time
+from typing import List, Optional
+
+from soco.data_structures import DidlAudioBroadcast, DidlMusicTrack, DidlResource
+
+SERVICE_NAMES = ["renderingControl", "avTransport", "contentDirectory", "zoneGroupTopology"]
+
+
+class FakeEvent:
+    def __init__(self, service: str, variables: dict):
+        self.service = service
+        self.variables = variables
+        self.timestamp = time.time()
+
+
+class FakeSubscription:
+    def __init__(self, service: "FakeService", requested_timeout: Optional[int]):
+        self.service = service
+        self.callback = None
+        self.auto_renew_fail = None
+        self.is_subscribed = True
+        self.timeout = requested_timeout or 86400
+        self._timestamp = time.time()
+
+    @property
+    def time_left(self) -> float:
+        return max(0.0, self.timeout - (time.time() - self._timestamp))
+
+    async def renew(self, requested_timeout=None, is_autorenew=False, strict=True):
+        self._timestamp = time.time()
+        return self
+
+    async def unsubscribe(self, strict=True):
+        self.is_subscribed = False
+        self.service.subscriptions.remove(self)
+
+
+class FakeService:
+    def __init__(self, device: "FakeSoCo", name: str):
+        self.device = device
+        self.name = name
+        self.subscriptions: List[FakeSubscription] = []
+
+    async def subscribe(self, requested_timeout=None, auto_renew=False, strict=True):
+        await asyncio.sleep(self.device.soap_delay)
+        sub = FakeSubscription(self, requested_timeout)
+        self.subscriptions.append(sub)
+        return sub
+
+    def notify(self, variables: dict):
+        """Deliver an event to every subscriber; call on the event loop"""
+        event = FakeEvent(self.name, variables)
+        for sub in list(self.subscriptions):
+            if sub.callback:
+                sub.callback(event)
+
+
+class FakeMusicLibrary:
+    def __init__(self, device: "FakeSoCo", favorites: int):
+        self.device = device
+        self.favorites = [
+            DidlAudioBroadcast(
+                title=f"Station {i}",
+                parent_id="R:0/0",
+                item_id=f"FV:2/{i}",
+                resources=[DidlResource(uri=f"x-rincon-mp3radio://stream.example/{i}", protocol_info="*:*:*:*")],
+            )
+            for i in range(favorites)
+        ]
+
+    def get_sonos_favorites(self, full_album_art_uri=False):
+        time.sleep(self.device.soap_delay * 4)
+        return self.favorites
+
+    def build_album_art_full_uri(self, url: str) -> str:
+        return f"http://{self.device.ip_address}:1400{url}"
+
+
+class FakeGroup:
+    """Every fake speaker is a group of its own; the benchmark does not model households"""
+
+    def __init__(self, coordinator: "FakeSoCo"):
+        self.coordinator = coordinator
+        self.members = {coordinator}
+
+    @property
+    def volume(self) -> int:
+        return self.coordinator.volume
+
+    @volume.setter
+    def volume(self, value: int):
+        self.coordinator.volume = value
+
+
+class FakeSoCo:
+    """A speaker answering every call after soap_delay seconds, from any thread"""
+
+    def __init__(self, ip_address: str, player_name: str, soap_delay: float = 0.02, favorites: int = 60):
+        self.ip_address = ip_address
+        self.player_name = player_name
+        self.uid = f"RINCON_FAKE{ip_address.replace('.', '')}"
+        self.is_visible = True
+        self.soap_delay = soap_delay
+        self.music_library = FakeMusicLibrary(self, favorites)
+        for name in SERVICE_NAMES:
+            setattr(self, name, FakeService(self, name))
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._volume = 20
+        self._transport_state = "STOPPED"
+
+    # Event replay
+
+    def rendering_event(self, volume: int):
+        self.renderingControl.notify({"volume": {"Master": str(volume)}})
+
+    def transport_event(self, title: str, artist: str = "Bench", transport_state: str = "PLAYING"):
+        metadata = DidlMusicTrack(
+            title=title,
+            parent_id="-1",
+            item_id="-1",
+            creator=artist,
+            album_art_uri=f"/getaa?s=1&u={title}",
+        )
+        self.avTransport.notify({
+            "transport_state": transport_state,
+            "current_track_uri": f"x-file-cifs://bench/{title}.mp3",
+            "current_track": "1",
+            "current_track_duration": "0:03:30",
+            "current_track_meta_data": metadata,
+        })
+
+    def _notify_threadsafe(self, func, *args):
+        if self.loop:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    # SoCo API, blocking like the real thing
+
+    @property
+    def volume(self) -> int:
+        time.sleep(self.soap_delay)
+        return self._volume
+
+    @volume.setter
+    def volume(self, value: int):
+        time.sleep(self.soap_delay)
+        self._volume = value
+        self._notify_threadsafe(self.rendering_event, value)
+
+    @property
+    def group(self) -> FakeGroup:
+        return FakeGroup(self)
+
+    @property
+    def all_groups(self) -> set:
+        return {self.group}
+
+    def get_current_transport_info(self) -> dict:
+        time.sleep(self.soap_delay)
+        return {"current_transport_state": self._transport_state}
+
+    def get_current_track_info(self) -> dict:
+        time.sleep(self.soap_delay)
+        return {"position": "0:00:00", "duration": "0:03:30"}
+
+    def play(self):
+        time.sleep(self.soap_delay)
+        self._transport_state = "PLAYING"
+
+    def pause(self):
+        time.sleep(self.soap_delay)
+        self._transport_state = "PAUSED_PLAYBACK"
+
+    def play_uri(self, uri: str = "", title: str = "", **kwargs):
+        time.sleep(self.soap_delay * 2)
+        self._transport_state = "PLAYING"
+        self._notify_threadsafe(self.transport_event, title)
@@ -0,0 +1,104 @@
+"""
+Startup time of the server: how long importing main takes, and how long until
+uvicorn answers HTTP requests.
+
+Run from apps/server:
+  python benchmarks/startup_bench.py            # the source tree
+  python benchmarks/startup_bench.py --dir dist # a build, e.g. after build.py --fast-start
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import(directory: str, env: dict):
+    """Total import time of main, and self time per top-level package, in seconds"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=directory, env=env, capture_output=True, text=True, check=True,
+    )
+    total = 0.0
+    packages = defaultdict(float)
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        packages[module.split(".")[0]] += int(self_us) / 1e6
+        if module == "main":
+            total = int(cumulative_us) / 1e6
+    return total, packages
+
+
+def measure_ready(directory: str, env: dict, timeout: float) -> float:
+    """Seconds from starting uvicorn until it answers /metrics"""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=directory, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=0.5) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"Server did not answer within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=SERVER_DIR, help="directory containing main.py")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="packages to list by import time")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    directory = os.path.abspath(args.dir)
+    env = dict(os.environ, TUNEHUB_DATA_DIR=tempfile.mkdtemp(prefix="tunehub-startup-"))
+
+    import_times = []
+    packages = defaultdict(list)
+    for _ in range(args.runs):
+        total, per_package = measure_import(directory, env)
+        import_times.append(total)
+        for package, seconds in per_package.items():
+            packages[package].append(seconds)
+
+    ready_times = [measure_ready(directory, env, args.timeout) for _ in range(args.runs)]
+
+    print(f"{directory}, {args.runs} runs")
+    print(f"import main:     median {statistics.median(import_times) * 1000:.0f}ms, min {min(import_times) * 1000:.0f}ms")
+    print(f"ready to serve:  median {statistics.median(ready_times) * 1000:.0f}ms, min {min(ready_times) * 1000:.0f}ms")
+    print()
+    print("slowest packages (median self time):")
+    ranked = sorted(packages.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for package, seconds in ranked[:args.top]:
+        print(f"  {package:<24} {statistics.median(seconds) * 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Load and latency benchmark for the websocket server.
+
+Starts the FastAPI app under uvicorn with fake in-process speakers, attaches N
+websocket clients, replays GENA rendering and transport events and fires action
+streams (volume drags, play, device switches). Reports event-to-client latency,
+broadcast throughput, memory and event-loop lag.
+
+Clients share the server's event loop, so their decoding shows up in the numbers;
+treat results as an upper bound and compare runs on the same hardware.
+
+Run from apps/server: python benchmarks/ws_bench.py --clients 20 --events 500
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_soco import FakeSoCo
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def rss_mb() -> float:
+    """Current resident set size; falls back to the peak where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic sleep wakes up, i.e. how long the loop was blocked"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval))
+
+
+class BenchClient:
+    """A websocket client recording when it saw each marked message"""
+
+    def __init__(self, url: str, codec: str):
+        self.url = url
+        self.codec = codec
+        self.ws = None
+        self.messages = 0
+        self.bytes = 0
+        # Value of each observed key -> perf_counter() it arrived
+        self.seen: Dict[tuple, float] = {}
+        self._reader: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        from websockets.asyncio.client import connect
+
+        self.ws = await connect(self.url, max_size=None, compression=None)
+        self._reader = asyncio.create_task(self._read())
+
+    async def send(self, action_type: str, data: dict):
+        message = {"type": action_type, "data": data}
+        if self.codec == "msgpack":
+            import msgpack
+
+            await self.ws.send(msgpack.packb(message))
+        else:
+            await self.ws.send(json.dumps(message))
+
+    async def close(self):
+        if self._reader:
+            self._reader.cancel()
+        if self.ws:
+            await self.ws.close()
+
+    def _decode(self, message):
+        if isinstance(message, bytes):
+            import msgpack
+
+            return msgpack.unpackb(message)
+        return json.loads(message)
+
+    async def _read(self):
+        async for message in self.ws:
+            received = time.perf_counter()
+            self.messages += 1
+            self.bytes += len(message)
+            self._record(self._decode(message), received)
+
+    def _record(self, event: dict, received: float):
+        event_type = event.get("type")
+        data = event.get("data")
+        if event_type == "batch":
+            for inner in data:
+                self._record(inner, received)
+        elif event_type == "snapshot":
+            for key, value in data["state"].items():
+                self._record({"type": key, "data": value}, received)
+        elif event_type == "play":
+            self.seen.setdefault(("title", data["track_info"]["title"]), received)
+        elif event_type == "volume":
+            self.seen.setdefault(("volume", data), received)
+        elif event_type == "active-device":
+            self.seen[("active-device", data["device_name"])] = received
+
+
+async def wait_all(clients: List[BenchClient], key: tuple, timeout: float) -> Optional[float]:
+    """Wait until every client saw key; returns the latest arrival time"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if all(key in client.seen for client in clients):
+            return max(client.seen[key] for client in clients)
+        await asyncio.sleep(0.002)
+    return None
+
+
+def latencies(clients: List[BenchClient], marks: Dict[tuple, float]) -> List[float]:
+    return [
+        client.seen[key] - sent
+        for client in clients
+        for key, sent in marks.items()
+        if key in client.seen
+    ]
+
+
+def summarize(values: List[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2) if values else None,
+        "p99_ms": round(percentile(values, 99) * 1000, 2) if values else None,
+        "max_ms": round(max(values) * 1000, 2) if values else None,
+    }
+
+
+async def run(args) -> dict:
+    import uvicorn
+
+    import device_io
+    import main
+    from registry import DeviceRecord, device_registry
+
+    # The server logs every event at INFO, which would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+
+    loop = asyncio.get_running_loop()
+    devices = [
+        FakeSoCo(f"10.254.0.{i + 1}", f"Bench Room {i + 1}", args.soap_delay, args.favorites)
+        for i in range(args.devices)
+    ]
+    for device in devices:
+        device.loop = loop
+
+    async def fake_refresh():
+        device_registry.update([
+            DeviceRecord(uid=device.uid, ip_address=device.ip_address, player_name=device.player_name)
+            for device in devices
+        ])
+        return devices
+
+    async def no_discovery():
+        return []
+
+    device_registry.refresh = fake_refresh
+    device_io.discover = no_discovery
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=0, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    while len(main.state.devices) < len(devices):
+        await asyncio.sleep(0.01)
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    rss_start = rss_mb()
+    results: dict = {"config": vars(args)}
+
+    # Connect
+    url = f"ws://127.0.0.1:{port}/ws?codec={args.codec}"
+    clients = [BenchClient(url, args.codec) for _ in range(args.clients)]
+    started = time.perf_counter()
+    await asyncio.gather(*(client.connect() for client in clients))
+    results["connect_s"] = round(time.perf_counter() - started, 3)
+    controller = clients[0]
+
+    # Device switches, the first one also selects the device events are replayed on
+    switch_latencies = []
+    for i in range(args.switches):
+        device = devices[i % len(devices)]
+        sent = time.perf_counter()
+        for client in clients:
+            client.seen.pop(("active-device", device.player_name), None)
+        await controller.send("active-device", {"device_name": device.player_name})
+        arrived = await wait_all(clients, ("active-device", device.player_name), args.timeout)
+        if arrived:
+            switch_latencies.append(arrived - sent)
+    results["device_switch"] = summarize(switch_latencies)
+    active = devices[(args.switches - 1) % len(devices)]
+    await asyncio.sleep(0.2)
+
+    # Replayed GENA events
+    messages_before = sum(client.messages for client in clients)
+    marks: Dict[tuple, float] = {}
+    started = time.perf_counter()
+    for i in range(args.events):
+        title = f"bench-{i}"
+        marks[("title", title)] = time.perf_counter()
+        active.transport_event(title)
+        if i % 4 == 0:
+            active.rendering_event(i % 100)
+        await asyncio.sleep(1 / args.rate)
+    await wait_all(clients, ("title", f"bench-{args.events - 1}"), args.timeout)
+    elapsed = time.perf_counter() - started
+    received = sum(client.messages for client in clients) - messages_before
+    # Titles replaced within one flush interval are never sent; only delivered ones count
+    results["gena_to_client"] = summarize(latencies(clients, marks))
+    results["throughput"] = {
+        "client_messages": received,
+        "client_messages_per_s": round(received / elapsed, 1),
+        "events_replayed": args.events,
+        "seconds": round(elapsed, 3),
+    }
+
+    # Volume drag: many slider values, all clients must end on the last one
+    drag_latencies = []
+    for drag in range(args.drags):
+        values = [(drag * 7 + step) % 101 for step in range(args.drag_steps)]
+        for value in values:
+            await controller.send("volume", {"volume": value})
+            await asyncio.sleep(0.01)
+        sent = time.perf_counter()
+        for client in clients:
+            client.seen.pop(("volume", values[-1]), None)
+        arrived = await wait_all(clients, ("volume", values[-1]), args.timeout)
+        if arrived:
+            drag_latencies.append(arrived - sent)
+        await asyncio.sleep(0.1)
+    results["volume_drag_settle"] = summarize(drag_latencies)
+
+    # Play favorites; the fake speaker confirms with a transport event
+    play_latencies = []
+    for i in range(args.plays):
+        favorite = active.music_library.favorites[i % len(active.music_library.favorites)]
+        for client in clients:
+            client.seen.pop(("title", favorite.title), None)
+        sent = time.perf_counter()
+        await controller.send("play", {"favorite_id": favorite.item_id})
+        arrived = await wait_all(clients, ("title", favorite.title), args.timeout)
+        if arrived:
+            play_latencies.append(arrived - sent)
+    results["play_to_track"] = summarize(play_latencies)
+
+    monitor.stop()
+    results["loop_lag"] = summarize(monitor.lags)
+    results["memory"] = {
+        "rss_start_mb": round(rss_start, 1),
+        "rss_end_mb": round(rss_mb(), 1),
+        "rss_peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    results["bytes_per_client"] = round(statistics.mean(client.bytes for client in clients))
+
+    await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+    server.should_exit = True
+    await server_task
+    return results
+
+
+def print_report(results: dict):
+    config = results["config"]
+    print(
+        f"{config['clients']} clients, {config['devices']} devices, codec {config['codec']}, "
+        f"soap delay {config['soap_delay'] * 1000:.0f}ms"
+    )
+    print(f"connect all clients: {results['connect_s']}s")
+    for name in ["gena_to_client", "device_switch", "volume_drag_settle", "play_to_track", "loop_lag"]:
+        stats = results[name]
+        print(f"{name:<20} n={stats['count']:<7} p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms max={stats['max_ms']}ms")
+    throughput = results["throughput"]
+    print(
+        f"throughput: {throughput['client_messages_per_s']} client messages/s "
+        f"({throughput['client_messages']} in {throughput['seconds']}s)"
+    )
+    memory = results["memory"]
+    print(f"memory: {memory['rss_start_mb']} -> {memory['rss_end_mb']} MB RSS, peak {memory['rss_peak_mb']} MB")
+    print(f"received per client: {results['bytes_per_client']} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--devices", type=int, default=2)
+    parser.add_argument("--events", type=int, default=300, help="transport events to replay")
+    parser.add_argument("--rate", type=float, default=100.0, help="replayed events per second")
+    parser.add_argument("--switches", type=int, default=6)
+    parser.add_argument("--drags", type=int, default=5)
+    parser.add_argument("--drag-steps", type=int, default=30)
+    parser.add_argument("--plays", type=int, default=5)
+    parser.add_argument("--favorites", type=int, default=60)
+    parser.add_argument("--soap-delay", type=float, default=0.02, help="seconds per fake SOAP call")
+    parser.add_argument("--codec", choices=["json", "msgpack"], default="json")
+    parser.add_argument("--warm", action="store_true", help="keep all devices subscribed")
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    # Read by config at import time, so set before the server modules load
+    os.environ["TUNEHUB_DATA_DIR"] = tempfile.mkdtemp(prefix="tunehub-bench-")
+    if args.warm:
+        os.environ["TUNEHUB_WARM_SUBSCRIPTIONS"] = "1"
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,13 @@
+"""
+Build the server into dist/.
+
+  python build.py               copy sources
+  python build.py --fast-start  also precompile bytecode for a quicker first boot
+"""
+import argparse
+import compileall
 import os
+import py_compile
 import shutil
 
 ROOT = os.path.dirname(os.path.abspath(__file__))
@@ -7,16 +16,35 @@ DIST = os.path.join(ROOT, "dist")
 # Files you want in the build output
 INCLUDE_FILES = [
     "main.py",
-    "app.py",
     "requirements.txt",
     "connection.py",
     "handlers.py",
     "sonos.py",
     "state.py",
+    "config.py",
+    "proxy.py",
+    "thumbnails.py",
+    "device_io.py",
+    "volume.py",
+    "favorites.py",
+    "registry.py",
+    "discovery.py",
+    "device_state.py",
+    "subscriptions.py",
+    "transport_events.py",
+    "codec.py",
+    "metrics.py",
+    "diagnostics.py",
+    "static.py",
+    "position.py",
+    "groups.py",
+    "soap_sessions.py",
+    "queue_loader.py",
 ]
 
 # Directories you actually have — adjust this for YOUR repo
 INCLUDE_DIRS = [
+    "assets",
 ]
 
 IGNORE_DIRS = {
@@ -24,6 +52,7 @@ IGNORE_DIRS = {
     ".venv",
     ".pytest_cache",
     "dist",
+    "data",
 }
 
 def copy_file(src, dest):
@@ -41,6 +70,14 @@ def copy_dir(src, dest):
         for file in files:
             shutil.copy2(os.path.join(root, file), os.path.join(dest_dir, file))
 
+parser = argparse.ArgumentParser(description="Build the server into dist/")
+parser.add_argument(
+    "--fast-start",
+    action="store_true",
+    help="precompile bytecode so the first boot on an SD card does not compile every module",
+)
+args = parser.parse_args()
+
 # Reset dist/
 if os.path.exists(DIST):
     shutil.rmtree(DIST)
@@ -58,4 +95,16 @@ for folder in INCLUDE_DIRS:
     if os.path.exists(src):
         copy_dir(src, os.path.join(DIST, folder))
 
+if args.fast_start:
+    # Unchecked-hash .pyc files are used without comparing against the sources,
+    # saving a stat per module. Rebuild after editing files in dist/.
+    ok = compileall.compile_dir(
+        DIST,
+        quiet=1,
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+    )
+    if not ok:
+        raise SystemExit("Bytecode compilation failed")
+    print("Precompiled bytecode")
+
 print("Python app built into dist/")
@@ -0,0 +1,123 @@
+"""Wire formats for websocket messages, negotiated per connection"""
+import logging
+import zlib
+from typing import List, Optional, Tuple, Type, TypeVar, Union
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, clients asking for it get JSON
+    msgpack = None
+
+# Subprotocols look like "tunehub.json" or "tunehub.msgpack+deflate"
+SUBPROTOCOL_PREFIX = "tunehub."
+DEFLATE_SUFFIX = "+deflate"
+
+Payload = Union[str, bytes]
+Model = TypeVar("Model", bound=BaseModel)
+
+
+def is_msgpack_available() -> bool:
+    return msgpack is not None
+
+
+class JsonCodec:
+    """JSON text frames, serialized and validated by pydantic-core without a dict round trip"""
+
+    name = "json"
+
+    def encode(self, event: BaseModel) -> Payload:
+        return event.model_dump_json(exclude_defaults=True)
+
+    def decode(self, message: Payload, model: Type[Model]) -> Model:
+        return model.model_validate_json(message)
+
+
+class MsgpackCodec:
+    """MessagePack binary frames; smaller than JSON and cheaper to parse on the client"""
+
+    name = "msgpack"
+
+    def encode(self, event: BaseModel) -> Payload:
+        return msgpack.packb(event.model_dump(mode="json", exclude_defaults=True))
+
+    def decode(self, message: Payload, model: Type[Model]) -> Model:
+        if isinstance(message, str):
+            # Clients may still send actions as JSON text
+            return model.model_validate_json(message)
+        return model.model_validate(msgpack.unpackb(message))
+
+
+class DeflateCodec:
+    """
+    Compresses payloads of at least min_bytes with zlib and sends them as binary
+    frames; smaller ones go out as the inner codec produces them. A zlib stream
+    starts with 0x78, which no JSON or MessagePack encoded event does, so clients
+    can tell compressed frames apart.
+    """
+
+    def __init__(self, inner, min_bytes: int, level: int = 6):
+        self.inner = inner
+        self.min_bytes = min_bytes
+        self.level = level
+        self.name = inner.name + DEFLATE_SUFFIX
+
+    def encode(self, event: BaseModel) -> Payload:
+        payload = self.inner.encode(event)
+        if len(payload) < self.min_bytes:
+            return payload
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        return zlib.compress(payload, self.level)
+
+    def decode(self, message: Payload, model: Type[Model]) -> Model:
+        if isinstance(message, bytes) and message[:1] == b"\x78":
+            message = zlib.decompress(message)
+            if isinstance(self.inner, JsonCodec):
+                message = message.decode("utf-8")
+        return self.inner.decode(message, model)
+
+
+JSON = JsonCodec()
+CODECS = {JSON.name: JSON}
+if is_msgpack_available():
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+
+def get_codec(name: Optional[str], deflate: bool = False, deflate_min_bytes: int = 4096):
+    """The codec with the given name, falling back to JSON for unknown or unavailable ones"""
+    codec = CODECS.get(name or JSON.name)
+    if codec is None:
+        logger.info(f"Codec {name} is not available, using JSON")
+        codec = JSON
+    if deflate:
+        codec = DeflateCodec(codec, deflate_min_bytes)
+    return codec
+
+
+def negotiate(
+    name: Optional[str],
+    deflate: bool,
+    subprotocols: List[str],
+    deflate_min_bytes: int = 4096,
+) -> Tuple[object, Optional[str]]:
+    """
+    Pick the codec for a connection: the codec query parameter wins, then the first
+    supported "tunehub.*" subprotocol the client offered. Returns the codec and the
+    subprotocol to accept, if any.
+    """
+    if name is None:
+        for subprotocol in subprotocols:
+            if not subprotocol.startswith(SUBPROTOCOL_PREFIX):
+                continue
+            requested = subprotocol[len(SUBPROTOCOL_PREFIX):]
+            wants_deflate = requested.endswith(DEFLATE_SUFFIX)
+            requested = requested.removesuffix(DEFLATE_SUFFIX)
+            if requested in CODECS:
+                codec = get_codec(requested, deflate or wants_deflate, deflate_min_bytes)
+                return codec, subprotocol
+
+    return get_codec(name, deflate, deflate_min_bytes), None
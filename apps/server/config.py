@@ -0,0 +1,122 @@
+"""Runtime configuration, overridable through TUNEHUB_* environment variables"""
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _env_str(name: str, default: str) -> str:
+    return os.environ.get(name, default)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Directory for caches and persisted state
+DATA_DIR = _env_str("TUNEHUB_DATA_DIR", os.path.join(BASE_DIR, "data"))
+
+# Album art proxy
+PROXY_PLACEHOLDER_PATH = os.path.join(BASE_DIR, "assets", "empty.png")
+PROXY_CACHE_DIR = _env_str("TUNEHUB_PROXY_CACHE_DIR", os.path.join(DATA_DIR, "cache", "images"))
+PROXY_TIMEOUT = _env_float("TUNEHUB_PROXY_TIMEOUT", 10.0)
+PROXY_MAX_CONNECTIONS = _env_int("TUNEHUB_PROXY_MAX_CONNECTIONS", 8)
+PROXY_MEMORY_CACHE_BYTES = _env_int("TUNEHUB_PROXY_MEMORY_CACHE_BYTES", 8 * 1024 * 1024)
+PROXY_DISK_CACHE_BYTES = _env_int("TUNEHUB_PROXY_DISK_CACHE_BYTES", 64 * 1024 * 1024)
+# Seconds before a cached image is revalidated against the speaker
+PROXY_REVALIDATE_AFTER = _env_float("TUNEHUB_PROXY_REVALIDATE_AFTER", 300.0)
+
+# State sync
+# Seconds to collect state changes before they are broadcast as one batch
+SYNC_FLUSH_INTERVAL = _env_float("TUNEHUB_SYNC_FLUSH_INTERVAL", 0.05)
+# Recent state changes kept so reconnecting clients only receive what they missed
+SYNC_HISTORY_SIZE = _env_int("TUNEHUB_SYNC_HISTORY_SIZE", 256)
+
+# Playback position
+# Seconds between position reads while playing, to catch drift; 0 disables them
+POSITION_DRIFT_CHECK_INTERVAL = _env_float("TUNEHUB_POSITION_DRIFT_CHECK_INTERVAL", 30.0)
+# Seconds the speaker may be off from the last anchor before clients get a new one
+POSITION_DRIFT_TOLERANCE = _env_float("TUNEHUB_POSITION_DRIFT_TOLERANCE", 1.0)
+
+# Websocket fan-out
+# Messages buffered per client before the slow-client policy applies
+WS_SEND_QUEUE_SIZE = _env_int("TUNEHUB_WS_SEND_QUEUE_SIZE", 64)
+# "disconnect" (client reconnects and resyncs) or "drop-oldest"
+WS_SLOW_CLIENT_POLICY = _env_str("TUNEHUB_WS_SLOW_CLIENT_POLICY", "disconnect")
+# Messages of at least this many bytes are compressed for clients that ask for deflate
+WS_DEFLATE_MIN_BYTES = _env_int("TUNEHUB_WS_DEFLATE_MIN_BYTES", 4096)
+
+# Static UI
+# Directory holding the built UI (index.html, assets/); the bundle puts it next to main.py
+STATIC_DIR = _env_str("TUNEHUB_STATIC_DIR", BASE_DIR)
+# Bytes of UI files, including compressed variants, held in memory
+STATIC_MEMORY_BYTES = _env_int("TUNEHUB_STATIC_MEMORY_BYTES", 16 * 1024 * 1024)
+# Larger files are streamed from disk
+STATIC_MEMORY_MAX_FILE = _env_int("TUNEHUB_STATIC_MEMORY_MAX_FILE", 2 * 1024 * 1024)
+
+# Device I/O
+# Threads available for blocking SoCo calls, shared by all speakers
+DEVICE_IO_MAX_WORKERS = _env_int("TUNEHUB_DEVICE_IO_MAX_WORKERS", 4)
+# Seconds a handler waits for a speaker before giving up
+DEVICE_IO_TIMEOUT = _env_float("TUNEHUB_DEVICE_IO_TIMEOUT", 5.0)
+# Keep-alive connections per speaker for SOAP calls
+SOAP_POOL_SIZE = _env_int("TUNEHUB_SOAP_POOL_SIZE", 2)
+# Seconds to establish a connection to a speaker; the response timeout is SOCO_REQUEST_TIMEOUT
+SOAP_CONNECT_TIMEOUT = _env_float("TUNEHUB_SOAP_CONNECT_TIMEOUT", 2.0)
+# Seconds after which idle connections are replaced instead of reused
+SOAP_IDLE_TIMEOUT = _env_float("TUNEHUB_SOAP_IDLE_TIMEOUT", 15.0)
+# Children browsed per request when queuing a container favorite in the background
+QUEUE_BROWSE_PAGE_SIZE = _env_int("TUNEHUB_QUEUE_BROWSE_PAGE_SIZE", 100)
+# Seconds a group action may take across all rooms before the stragglers count as failed
+GROUP_ACTION_DEADLINE = _env_float("TUNEHUB_GROUP_ACTION_DEADLINE", 5.0)
+# Seconds before SoCo abandons a SOAP request, freeing its worker thread
+SOCO_REQUEST_TIMEOUT = _env_float("TUNEHUB_SOCO_REQUEST_TIMEOUT", 10.0)
+
+# Favorites
+FAVORITES_SNAPSHOT_PATH = _env_str("TUNEHUB_FAVORITES_SNAPSHOT", os.path.join(DATA_DIR, "favorites.json"))
+
+# Devices
+DEVICE_REGISTRY_PATH = _env_str("TUNEHUB_DEVICE_REGISTRY", os.path.join(DATA_DIR, "devices.json"))
+
+# Discovery
+# Device description probes in flight at once during a subnet scan
+DISCOVERY_CONCURRENCY = _env_int("TUNEHUB_DISCOVERY_CONCURRENCY", 64)
+# Seconds to wait for a single address before moving on
+DISCOVERY_PROBE_TIMEOUT = _env_float("TUNEHUB_DISCOVERY_PROBE_TIMEOUT", 1.0)
+# Network to scan, e.g. "192.168.1.0/24"; defaults to the /24 of the local address
+DISCOVERY_SUBNET = _env_str("TUNEHUB_DISCOVERY_SUBNET", "") or None
+
+# Subscriptions
+# Subscribe to every device instead of only the active one, so switching rooms is instant
+WARM_SUBSCRIPTIONS = _env_bool("TUNEHUB_WARM_SUBSCRIPTIONS", False)
+# Seconds of validity requested per subscription; renewed automatically before expiry
+SUBSCRIPTION_TIMEOUT = _env_int("TUNEHUB_SUBSCRIPTION_TIMEOUT", 600)
+# Seconds without events after which subscriptions are renewed to check the speaker still has them
+SUBSCRIPTION_HEARTBEAT_INTERVAL = _env_float("TUNEHUB_SUBSCRIPTION_HEARTBEAT_INTERVAL", 60.0)
+# First and longest delay between resubscription attempts, before jitter
+SUBSCRIPTION_BACKOFF_BASE = _env_float("TUNEHUB_SUBSCRIPTION_BACKOFF_BASE", 2.0)
+SUBSCRIPTION_BACKOFF_MAX = _env_float("TUNEHUB_SUBSCRIPTION_BACKOFF_MAX", 60.0)
+
+# Diagnostics
+# Log the event loop's stack when it is blocked longer than this many seconds
+LOOP_STALL_THRESHOLD = _env_float("TUNEHUB_LOOP_STALL_THRESHOLD", 0.25)
+# Seconds between watchdog heartbeats; also the resolution of the loop lag histogram
+LOOP_WATCHDOG_INTERVAL = _env_float("TUNEHUB_LOOP_WATCHDOG_INTERVAL", 0.1)
+# Longest profile /debug/profile will record, in seconds
+PROFILE_MAX_SECONDS = _env_float("TUNEHUB_PROFILE_MAX_SECONDS", 60.0)
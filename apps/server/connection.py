@@ -1,7 +1,18 @@
+import asyncio
+import logging
+import time
 from fastapi import WebSocket
 from starlette.websockets import WebSocketDisconnect
 from pydantic import BaseModel
 from typing import Any, Dict, List, Optional
+import codec as wire
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# What to do when a client's outbound queue is full
+SLOW_CLIENT_DROP_OLDEST = "drop-oldest"
+SLOW_CLIENT_DISCONNECT = "disconnect"
 
 class Action(BaseModel):
     type: str
@@ -10,36 +21,153 @@ class Action(BaseModel):
 class Event(BaseModel):
     type: str
     data: Any
+    # Position in the state change stream; unset for replies to a single client
+    seq: Optional[int] = None
+
+class ClientConnection:
+    """A websocket with a bounded outbound queue drained by its own writer task"""
+
+    def __init__(self, ws: WebSocket, max_queue: int, codec=wire.JSON):
+        self.ws = ws
+        self.codec = codec
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.sent = 0
+        self.dropped = 0
+        self.writer: Optional[asyncio.Task] = None
+
+    def stats(self) -> dict:
+        return {
+            "client": f"{self.ws.client.host}:{self.ws.client.port}" if self.ws.client else None,
+            "codec": self.codec.name,
+            "queue_depth": self.queue.qsize(),
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, max_queue: int = 64, slow_client_policy: str = SLOW_CLIENT_DISCONNECT):
         self.active_connections: List[WebSocket] = []
+        self.max_queue = max_queue
+        self.slow_client_policy = slow_client_policy
+        self._clients: Dict[WebSocket, ClientConnection] = {}
+        self.slow_disconnects = 0
 
-    async def connect(self, ws: WebSocket):
-        await ws.accept()
+    async def connect(self, ws: WebSocket, codec=wire.JSON, subprotocol: Optional[str] = None):
+        await ws.accept(subprotocol=subprotocol)
+        client = ClientConnection(ws, self.max_queue, codec)
+        client.writer = asyncio.create_task(self._write_loop(client))
+        self._clients[ws] = client
         self.active_connections.append(ws)
 
     def disconnect(self, ws: WebSocket):
         if ws in self.active_connections:
             self.active_connections.remove(ws)
 
+        client = self._clients.pop(ws, None)
+        if client and client.writer and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    @staticmethod
+    def encode(event: Event, codec=wire.JSON) -> wire.Payload:
+        """Serialize an event for the wire"""
+        return codec.encode(event)
+
+    async def receive_action(self, ws: WebSocket) -> Action:
+        """Wait for the next action from a client, decoded with its codec"""
+        message = await ws.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+
+        client = self._clients.get(ws)
+        codec = client.codec if client else wire.JSON
+        payload = message.get("bytes")
+        if payload is None:
+            payload = message.get("text")
+        return codec.decode(payload, Action)
+
+    async def _write_loop(self, client: ClientConnection):
+        """Drain a client's queue; a failed send removes the client"""
+        try:
+            while True:
+                payload = await client.queue.get()
+                if isinstance(payload, bytes):
+                    await client.ws.send_bytes(payload)
+                else:
+                    await client.ws.send_text(payload)
+                client.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Socket is closed or cannot send anymore; remove it
+            metrics.send_failures.inc("error")
+            logger.debug(f"Dropping client after failed send: {e}")
+            self.disconnect(client.ws)
+
+    def _enqueue(self, client: ClientConnection, payload: wire.Payload):
+        try:
+            client.queue.put_nowait(payload)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        client.dropped += 1
+        metrics.send_failures.inc("queue_full")
+        if self.slow_client_policy == SLOW_CLIENT_DROP_OLDEST:
+            client.queue.get_nowait()
+            client.queue.put_nowait(payload)
+            return
+
+        # Disconnecting lets the client reconnect and receive a full state sync,
+        # instead of silently missing updates
+        logger.warning(f"Disconnecting slow client ({client.queue.qsize()} messages queued)")
+        self.slow_disconnects += 1
+        self.disconnect(client.ws)
+        asyncio.create_task(self._close(client.ws))
+
+    @staticmethod
+    async def _close(ws: WebSocket):
+        try:
+            await ws.close(code=1013, reason="Client too slow")
+        except Exception:
+            pass
+
     async def send_event(self, event: Event, ws: WebSocket):
+        client = self._clients.get(ws)
+        if client:
+            self._enqueue(client, self.encode(event, client.codec))
+            return
+
         try:
-            await ws.send_json(event.dict())
+            await ws.send_text(self.encode(event))
         except (WebSocketDisconnect, RuntimeError):
-            # Socket is closed or cannot send anymore; remove it
-            if ws in self.active_connections:
-                self.active_connections.remove(ws)
-            # Do not re-raise; treat as a stale connection
+            # Socket is closed or cannot send anymore; treat as a stale connection
+            pass
 
     async def broadcast(self, event: Event):
-        # Create a copy to avoid modification during iteration
-        connections = self.active_connections.copy()
+        # Serialize once per codec, then hand the same payload to every client's queue
+        started = time.perf_counter()
+        payloads: Dict[str, wire.Payload] = {}
+        clients = list(self._clients.values())
+
+        # Iterate over a copy to avoid modification during iteration
+        for client in clients:
+            payload = payloads.get(client.codec.name)
+            if payload is None:
+                payload = payloads[client.codec.name] = self.encode(event, client.codec)
+            self._enqueue(client, payload)
 
-        for connection in connections:
-            try:
-                await self.send_event(event, connection)
-            except Exception:
-                # send_event already removes bad connections; ignore any leftover errors
-                pass
+        metrics.broadcast_messages.inc(amount=len(clients))
+        metrics.broadcast_seconds.observe(time.perf_counter() - started)
 
+    def stats(self) -> dict:
+        """Queue depth and drop counters per client, for tuning the queue size and policy"""
+        clients = [client.stats() for client in self._clients.values()]
+        return {
+            "connections": len(clients),
+            "max_queue": self.max_queue,
+            "slow_client_policy": self.slow_client_policy,
+            "slow_disconnects": self.slow_disconnects,
+            "queued": sum(client["queue_depth"] for client in clients),
+            "dropped": sum(client["dropped"] for client in clients),
+            "clients": clients,
+        }
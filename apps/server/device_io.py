@@ -0,0 +1,162 @@
+"""Awaitable access to SoCo, which only offers blocking calls"""
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+import soco
+from soco import SoCo
+from soco.exceptions import SoCoException
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceTimeout(Exception):
+    """A device did not answer within the allowed time"""
+
+
+# What a call to a speaker raises when it answers with a fault (SoCoUPnPException
+# is a SoCoException) or cannot be reached; RequestException is an OSError too
+DEVICE_ERRORS = (SoCoException, requests.RequestException, OSError)
+
+
+class DeviceExecutor:
+    """
+    Runs blocking SoCo calls on a bounded thread pool.
+    Calls for the same device are serialized, so commands reach a speaker in the
+    order they were issued, while different speakers are driven in parallel.
+    """
+
+    def __init__(self, max_workers: int, timeout: float):
+        self.timeout = timeout
+        self._max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self._max_workers, thread_name_prefix="soco"
+            )
+        return self._pool
+
+    def _lock_for(self, device: SoCo) -> asyncio.Lock:
+        # ip_address is a plain attribute; uid and player_name may hit the network
+        lock = self._locks.get(device.ip_address)
+        if lock is None:
+            lock = self._locks[device.ip_address] = asyncio.Lock()
+        return lock
+
+    def _submit(self, func: Callable, *args, **kwargs) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.pool, functools.partial(func, *args, **kwargs))
+
+    async def _wait(self, future: asyncio.Future, func: Callable, timeout: Optional[float]) -> Any:
+        try:
+            # Shielded: giving up on the result does not stop the worker thread
+            return await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            raise DeviceTimeout(f"{getattr(func, '__name__', func)} timed out")
+
+    async def run_unbound(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run a blocking call that is not tied to a single device"""
+        # The worker thread keeps running after a timeout until SoCo's own request timeout
+        return await self._wait(self._submit(func, *args, **kwargs), func, timeout)
+
+    async def run(self, device: SoCo, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Run a blocking call against a device, after any earlier call to it finished.
+        A call that timed out still holds the device until its worker thread returns,
+        so the next call cannot overtake it on the speaker.
+        """
+        lock = self._lock_for(device)
+        await lock.acquire()
+        name = _call_name(func, args)
+        started = time.perf_counter()
+        future = None
+        try:
+            future = self._submit(func, *args, **kwargs)
+            return await self._wait(future, func, timeout)
+        except DeviceTimeout:
+            metrics.soco_call_timeouts.inc(name, device.ip_address)
+            logger.warning(f"Device {device.ip_address} did not answer {name}")
+            raise DeviceTimeout(f"Device {device.ip_address} did not respond")
+        finally:
+            metrics.soco_call_seconds.observe(time.perf_counter() - started, name, device.ip_address)
+            if future is None or future.done():
+                lock.release()
+            else:
+                future.add_done_callback(functools.partial(_release_when_done, lock))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def _release_when_done(lock: asyncio.Lock, future: asyncio.Future):
+    """Free the device once an abandoned call returns; its outcome has no one left to read it"""
+    if not future.cancelled():
+        future.exception()
+    lock.release()
+
+
+def _call_name(func: Callable, args: tuple) -> str:
+    """Metric label for a call: the method name, or e.g. "setattr:volume" for properties"""
+    if func in (getattr, setattr) and len(args) > 1:
+        return f"{func.__name__}:{args[1]}"
+    return getattr(func, "__name__", type(func).__name__)
+
+
+class AsyncDevice:
+    """Awaitable view of a SoCo instance"""
+
+    def __init__(self, executor: DeviceExecutor, device: SoCo):
+        self._executor = executor
+        self.device = device
+
+    async def call(self, method: str, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Call a SoCo method, e.g. await dev.call("pause")"""
+        return await self._executor.run(
+            self.device, getattr(self.device, method), *args, timeout=timeout, **kwargs
+        )
+
+    async def get(self, attribute: str, timeout: Optional[float] = None) -> Any:
+        """Read a SoCo property, e.g. await dev.get("volume")"""
+        return await self._executor.run(self.device, getattr, self.device, attribute, timeout=timeout)
+
+    async def set(self, attribute: str, value: Any, timeout: Optional[float] = None):
+        """Write a SoCo property, e.g. await dev.set("volume", 30)"""
+        await self._executor.run(self.device, setattr, self.device, attribute, value, timeout=timeout)
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run a helper that takes the device as first argument, e.g. play_favorite"""
+        return await self._executor.run(
+            self.device, func, self.device, *args, timeout=timeout, **kwargs
+        )
+
+
+executor = DeviceExecutor(
+    max_workers=config.DEVICE_IO_MAX_WORKERS,
+    timeout=config.DEVICE_IO_TIMEOUT,
+)
+
+
+def async_device(device: SoCo) -> AsyncDevice:
+    return AsyncDevice(executor, device)
+
+
+async def discover(timeout: int = 5) -> List[SoCo]:
+    """Multicast discovery without blocking the event loop"""
+    # soco.discover takes its own timeout argument, so bind it before handing over
+    devices = await executor.run_unbound(
+        functools.partial(soco.discover, timeout=timeout), timeout=timeout + 2
+    )
+    return list(devices or [])
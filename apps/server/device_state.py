@@ -0,0 +1,82 @@
+"""Last known playback state of every subscribed device, fed by its events"""
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from soco import SoCo
+
+import metrics
+from device_io import async_device
+from subscriptions import subscription_supervisor
+
+property_reads = metrics.registry.counter(
+    "tunehub_device_property_reads_total", "Device properties read by handlers, by where the value came from",
+    ["property", "source"],
+)
+
+
+@dataclass
+class DeviceState:
+    volume: Optional[int] = None
+    playback_state: Optional[str] = None
+    track_info: Optional[dict] = None
+    # time.time() of the last event that changed anything
+    updated_at: float = 0.0
+    # time.monotonic() each property was last recorded, to judge its freshness
+    recorded_at: Dict[str, float] = field(default_factory=dict)
+
+
+class DeviceStateCache:
+    """
+    Holds volume, transport state and track info per device, so switching the
+    active device can show the new one's state without asking the speaker, and
+    handlers can decide what to do without a SOAP round trip.
+
+    A value is fresh while the device's subscriptions are up and it was recorded
+    after they were established: from then on every change arrives as an event.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, DeviceState] = {}
+
+    def get(self, device: SoCo) -> Optional[DeviceState]:
+        return self._states.get(device.ip_address)
+
+    def update(self, device: SoCo, **values):
+        device_state = self._states.setdefault(device.ip_address, DeviceState())
+        now = time.monotonic()
+        for name, value in values.items():
+            setattr(device_state, name, value)
+            device_state.recorded_at[name] = now
+        device_state.updated_at = time.time()
+
+    def fresh(self, device: SoCo, name: str) -> Optional[Any]:
+        """A property's cached value if events are keeping it current, else None"""
+        device_state = self._states.get(device.ip_address)
+        since = subscription_supervisor.active_since(device)
+        if device_state is None or since is None:
+            return None
+        recorded_at = device_state.recorded_at.get(name)
+        if recorded_at is None or recorded_at < since:
+            # From before the current subscriptions; changes may have been missed
+            return None
+        return getattr(device_state, name)
+
+    def forget(self, device: SoCo):
+        self._states.pop(device.ip_address, None)
+
+    async def playback_state(self, device: SoCo) -> Optional[str]:
+        """The device's transport state, e.g. PLAYING, from its events when possible"""
+        playback_state = self.fresh(device, "playback_state")
+        if playback_state is not None:
+            property_reads.inc("playback_state", "cache")
+            return playback_state
+
+        property_reads.inc("playback_state", "live")
+        info = await async_device(device).call("get_current_transport_info")
+        playback_state = info.get("current_transport_state")
+        self.update(device, playback_state=playback_state)
+        return playback_state
+
+
+device_states = DeviceStateCache()
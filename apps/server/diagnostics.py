@@ -0,0 +1,154 @@
+"""Event loop lag watchdog and a sampling profiler, for diagnosing stalls on deployed kiosks"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Dict, Optional
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+loop_lag_seconds = metrics.registry.histogram(
+    "tunehub_loop_lag_seconds",
+    "How late the event loop woke up for the watchdog heartbeat",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+# Incremented from the watchdog thread
+loop_stalls = metrics.registry.register(metrics.ThreadSafe(metrics.Counter(
+    "tunehub_loop_stalls_total", "Times the event loop was blocked longer than the stall threshold"
+)))
+
+
+class LoopWatchdog:
+    """
+    A heartbeat task on the event loop records how late each tick runs. A separate
+    thread checks the heartbeat; when the loop has not ticked for longer than the
+    threshold it logs what the loop thread is executing at that moment, which is
+    the blocking call itself, not the code that happens to run after it.
+    """
+
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval
+        self.threshold = threshold
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._last_beat = time.monotonic()
+            loop_lag_seconds.observe(max(0.0, self._last_beat - started - self.interval))
+
+    def _watch(self):
+        stalled_since: Optional[float] = None
+        while not self._stop.wait(self.interval / 2):
+            last_beat = self._last_beat
+            blocked = time.monotonic() - last_beat - self.interval
+            if blocked < self.threshold:
+                if stalled_since is not None:
+                    logger.warning(f"Event loop recovered after {time.monotonic() - stalled_since:.2f}s")
+                    stalled_since = None
+                continue
+            if stalled_since is not None:
+                # Already reported this stall
+                continue
+
+            stalled_since = last_beat + self.interval
+            loop_stalls.inc()
+            logger.warning(
+                f"Event loop blocked for {blocked:.2f}s in {self._current_task()}:\n{self._loop_stack()}"
+            )
+
+    def _current_task(self) -> str:
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        if task is None:
+            return "a callback"
+        return f"task {task.get_name()} ({task.get_coro().__qualname__})"
+
+    def _loop_stack(self) -> str:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return "<no stack>"
+        return "".join(traceback.format_stack(frame))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # ';' separates frames in the collapsed format
+    name = getattr(code, "co_qualname", code.co_name).replace(";", ":")
+    return f"{name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def sample_stacks(seconds: float, interval: float) -> Dict[str, int]:
+    """
+    Sample every thread's stack for the given time. Blocking; run it in a thread.
+    Returns collapsed stacks ("thread;outer;...;inner") with their sample counts.
+    """
+    own_id = threading.get_ident()
+    samples: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            samples[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return samples
+
+
+class SamplingProfiler:
+    """Runs one sampling session at a time and renders it for flamegraph.pl or speedscope"""
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    async def profile(self, seconds: float, interval: float = 0.005) -> str:
+        async with self._lock:
+            samples = await asyncio.to_thread(sample_stacks, seconds, interval)
+        lines = [f"{stack} {count}" for stack, count in samples.most_common()]
+        return "\n".join(lines) + "\n"
+
+
+watchdog = LoopWatchdog(
+    interval=config.LOOP_WATCHDOG_INTERVAL,
+    threshold=config.LOOP_STALL_THRESHOLD,
+)
+profiler = SamplingProfiler()
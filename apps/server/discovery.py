@@ -0,0 +1,137 @@
+"""Device discovery: multicast plus a unicast sweep of the local subnet"""
+import asyncio
+import ipaddress
+import logging
+import socket
+import xml.etree.ElementTree as ET
+from typing import Callable, List, Optional
+
+from soco import SoCo
+
+import config
+import device_io
+from device_io import async_device
+from registry import DeviceRecord, device_registry, describe_visible
+
+logger = logging.getLogger(__name__)
+
+DESCRIPTION_URL = "http://{ip}:1400/xml/device_description.xml"
+UPNP_NS = "{urn:schemas-upnp-org:device-1-0}"
+
+
+def local_network(subnet: Optional[str] = None) -> Optional[ipaddress.IPv4Network]:
+    """The network to sweep: the configured one, or the /24 around our own address"""
+    if subnet:
+        return ipaddress.ip_network(subnet, strict=False)
+
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            # No packet is sent; this only selects the outgoing interface
+            s.connect(("192.0.2.1", 1400))
+            local_ip = s.getsockname()[0]
+    except OSError:
+        return None
+    return ipaddress.ip_network(f"{local_ip}/24", strict=False)
+
+
+def is_sonos_description(body: str) -> bool:
+    try:
+        root = ET.fromstring(body)
+    except ET.ParseError:
+        return False
+    manufacturer = root.findtext(f".//{UPNP_NS}manufacturer") or ""
+    udn = root.findtext(f".//{UPNP_NS}UDN") or ""
+    return "Sonos" in manufacturer or udn.startswith("uuid:RINCON_")
+
+
+class DiscoveryEngine:
+    """
+    Runs multicast discovery and a bounded-concurrency unicast probe of the
+    subnet side by side, and checks the speakers in the registry, which may sit
+    outside the swept subnet. Each device is reported as soon as it is confirmed,
+    so clients see speakers appear during the scan rather than after it.
+    """
+
+    def __init__(self, concurrency: int, probe_timeout: float, subnet: Optional[str] = None):
+        self.concurrency = concurrency
+        self.probe_timeout = probe_timeout
+        self.subnet = subnet
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, on_found: Callable[[SoCo], None]) -> asyncio.Task:
+        """Start a scan in the background, or join the one already running"""
+        if not self.running:
+            self._task = asyncio.create_task(self._scan(on_found))
+        return self._task
+
+    async def _scan(self, on_found: Callable[[SoCo], None]) -> List[SoCo]:
+        seen: set = set()
+        found: List[DeviceRecord] = []
+
+        async def confirm(device: SoCo):
+            if device.ip_address in seen:
+                return
+            seen.add(device.ip_address)
+            try:
+                record = await async_device(device).run(describe_visible)
+            except Exception as e:
+                logger.debug(f"Could not describe device at {device.ip_address}: {e}")
+                return
+            if record is None:
+                # Bonded satellites, subs and bridges are not rooms of their own
+                return
+            found.append(record)
+            device_registry.update([record])
+            on_found(device)
+
+        async def multicast():
+            try:
+                devices = await device_io.discover()
+            except Exception as e:
+                logger.warning(f"Multicast discovery failed: {e}")
+                return
+            await asyncio.gather(*(confirm(device) for device in devices))
+
+        async def known():
+            await asyncio.gather(*(confirm(device) for device in device_registry.devices()))
+
+        logger.info("Scanning for devices")
+        await asyncio.gather(multicast(), known(), self._sweep(confirm))
+        await device_registry.save()
+        logger.info(f"Scan finished, found {len(found)} device(s)")
+        return [SoCo(record.ip_address) for record in found]
+
+    async def _sweep(self, confirm):
+        network = local_network(self.subnet)
+        if network is None:
+            logger.warning("Could not determine the local network, skipping unicast scan")
+            return
+
+        # Imported here so it does not slow down startup
+        import httpx
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=0)
+        async with httpx.AsyncClient(timeout=self.probe_timeout, limits=limits) as client:
+
+            async def probe(ip: str):
+                async with semaphore:
+                    try:
+                        response = await client.get(DESCRIPTION_URL.format(ip=ip))
+                    except httpx.HTTPError:
+                        return
+                if response.status_code == 200 and is_sonos_description(response.text):
+                    await confirm(SoCo(ip))
+
+            await asyncio.gather(*(probe(str(host)) for host in network.hosts()))
+
+
+discovery_engine = DiscoveryEngine(
+    concurrency=config.DISCOVERY_CONCURRENCY,
+    probe_timeout=config.DISCOVERY_PROBE_TIMEOUT,
+    subnet=config.DISCOVERY_SUBNET,
+)
@@ -0,0 +1,172 @@
+"""Per-device favorites cache, invalidated by ContentDirectory events"""
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from soco import SoCo
+from soco.data_structures import to_didl_string
+from soco.data_structures_entry import from_didl_string
+
+import config
+from device_io import async_device
+from sonos import Favorite, get_playable_favorites
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 2
+# ContainerUpdateIDs entries look like "FV:2,117"; FV is the favorites container
+FAVORITES_CONTAINER_PREFIX = "FV:"
+
+
+@dataclass
+class FavoritesEntry:
+    favorites: List[Favorite]
+    # FavoritesUpdateID the list belongs to, None if it is not known yet
+    update_id: Optional[str] = None
+    # Browsed in this process, as opposed to loaded from the snapshot
+    live: bool = False
+
+
+class FavoritesCache:
+    """
+    Browses a device's favorites once and keeps them until the speaker reports a
+    change through FavoritesUpdateID/ContainerUpdateIDs. A snapshot on disk fills
+    the cache right after a restart.
+    """
+
+    def __init__(self, snapshot_path: str):
+        self.snapshot_path = snapshot_path
+        self._entries: Dict[str, FavoritesEntry] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+
+    def cached(self, device: SoCo) -> Optional[List[Favorite]]:
+        entry = self._entries.get(device.ip_address)
+        return entry.favorites if entry else None
+
+    async def get(self, device: SoCo) -> List[Favorite]:
+        """Cached favorites for a device, browsing only on a miss"""
+        entry = self._entries.get(device.ip_address)
+        if entry is not None:
+            return entry.favorites
+
+        # Concurrent misses for one device share a single browse
+        key = device.ip_address
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._browse(device))
+            self._loading[key] = task
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _browse(self, device: SoCo) -> List[Favorite]:
+        logger.info(f"Browsing favorites of {device.ip_address}")
+        favorites = await async_device(device).run(get_playable_favorites, timeout=15.0)
+        self._entries[device.ip_address] = FavoritesEntry(favorites=favorites, live=True)
+        await self.save()
+        return favorites
+
+    def invalidate(self, device: SoCo):
+        self._entries.pop(device.ip_address, None)
+
+    def handle_event(self, device: SoCo, variables: dict) -> bool:
+        """
+        Apply a ContentDirectory event. Returns True when the device's favorites
+        changed and have been dropped from the cache.
+        """
+        update_id = variables.get("favorites_update_id")
+        container_ids = variables.get("container_update_i_ds") or ""
+        favorites_touched = FAVORITES_CONTAINER_PREFIX in container_ids
+
+        if update_id is None and not favorites_touched:
+            return False
+
+        entry = self._entries.get(device.ip_address)
+        if entry is None:
+            return False
+
+        if update_id is not None:
+            if entry.update_id == update_id:
+                return False
+            if entry.update_id is None and entry.live:
+                # First event after a fresh browse tells us which version we hold
+                entry.update_id = update_id
+                asyncio.ensure_future(self.save())
+                return False
+
+        logger.info(f"Favorites changed on {device.ip_address}, invalidating cache")
+        self.invalidate(device)
+        return True
+
+    async def load(self):
+        """Fill the cache from the snapshot written by a previous run"""
+        entries = await asyncio.to_thread(self._read_snapshot)
+        for key, entry in entries.items():
+            self._entries.setdefault(key, entry)
+        if entries:
+            logger.info(f"Loaded favorites snapshot for {len(entries)} device(s)")
+
+    async def save(self):
+        entries = dict(self._entries)
+        await asyncio.to_thread(self._write_snapshot, entries)
+
+    def _read_snapshot(self) -> Dict[str, FavoritesEntry]:
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return {}
+
+        entries = {}
+        for key, device_snapshot in snapshot.get("devices", {}).items():
+            try:
+                favorites = [_favorite_from_json(item) for item in device_snapshot["favorites"]]
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable favorites snapshot for {key}: {e}")
+                continue
+            entries[key] = FavoritesEntry(
+                favorites=favorites,
+                update_id=device_snapshot.get("update_id"),
+            )
+        return entries
+
+    def _write_snapshot(self, entries: Dict[str, FavoritesEntry]):
+        devices = {}
+        for key, entry in entries.items():
+            favorites = []
+            for favorite in entry.favorites:
+                try:
+                    favorites.append(_favorite_to_json(favorite))
+                except Exception as e:
+                    logger.debug(f"Not snapshotting favorite {favorite.get('title')}: {e}")
+            devices[key] = {"update_id": entry.update_id, "favorites": favorites}
+
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": SNAPSHOT_VERSION, "devices": devices}, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logger.warning(f"Failed to write favorites snapshot: {e}")
+
+
+def _favorite_to_json(favorite: Favorite) -> dict:
+    item = dict(favorite)
+    # The DIDL reference is what play_favorite needs; keep it as DIDL-Lite XML
+    item["ref"] = to_didl_string(favorite["ref"])
+    return item
+
+
+def _favorite_from_json(item: dict) -> Favorite:
+    favorite = dict(item)
+    favorite["ref"] = from_didl_string(item["ref"])[0]
+    return favorite
+
+
+favorites_cache = FavoritesCache(config.FAVORITES_SNAPSHOT_PATH)
@@ -0,0 +1,170 @@
+"""Group-wide control: one call per zone group where Sonos allows it, concurrent calls otherwise"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from soco import SoCo
+
+import config
+from device_io import async_device, DeviceTimeout
+from device_state import device_states
+from registry import known_player_name
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+TIMEOUT = "timeout"
+ERROR = "error"
+
+
+@dataclass
+class Group:
+    coordinator: SoCo
+    # Visible members, coordinator included
+    members: List[SoCo]
+
+
+def _household_groups(device: SoCo) -> List[Group]:
+    """
+    The household's zone groups. Blocking: visibility comes from the zone group
+    state, which SoCo may have to fetch.
+    """
+    groups = []
+    for group in device.all_groups:
+        if not group.coordinator or not group.coordinator.is_visible:
+            continue
+        members = [member for member in group.members if member.is_visible]
+        groups.append(Group(coordinator=group.coordinator, members=members))
+    return groups
+
+
+def _set_group_volume(coordinator: SoCo, volume: int):
+    """SetGroupVolume on the coordinator scales every member like the Sonos app does"""
+    coordinator.group.volume = volume
+
+
+def _pause_group(coordinator: SoCo):
+    """Pausing the coordinator pauses its whole group"""
+    coordinator.pause()
+
+
+def _pause_group_if_playing(coordinator: SoCo):
+    """For groups whose state is not known from events; pausing a stopped group fails"""
+    if coordinator.get_current_transport_info()["current_transport_state"] == "PLAYING":
+        coordinator.pause()
+
+
+def _join(device: SoCo, coordinator: SoCo):
+    device.join(coordinator)
+
+
+def _unjoin(device: SoCo):
+    device.unjoin()
+
+
+class GroupController:
+    """
+    Runs actions on several speakers at once. Calls go out concurrently, each
+    device still serialized by the device executor, and all of them share one
+    deadline. Clients get the outcome as a single groups update, not one per member.
+    """
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        # Group volumes we set, by coordinator ip
+        self._volumes: Dict[str, int] = {}
+        self._groups: List[Group] = []
+
+    async def refresh(self, device: SoCo) -> List[dict]:
+        """Read the zone groups through one device; SoCo answers from its topology cache"""
+        self._groups = await async_device(device).run(_household_groups)
+        return self.describe()
+
+    def describe(self) -> List[dict]:
+        """Groups as sent to clients, the coordinator's name first among the members"""
+        groups = []
+        for group in self._groups:
+            coordinator = group.coordinator
+            coordinator_name = known_player_name(coordinator)
+            members = sorted(
+                known_player_name(member) for member in group.members
+                if member.ip_address != coordinator.ip_address
+            )
+            cached = device_states.get(coordinator)
+            groups.append({
+                "coordinator": coordinator_name,
+                "members": [coordinator_name, *members],
+                "volume": self._volumes.get(coordinator.ip_address),
+                "playback_state": cached.playback_state if cached else None,
+            })
+        return sorted(groups, key=lambda group: group["coordinator"])
+
+    def coordinators(self) -> List[SoCo]:
+        return [group.coordinator for group in self._groups]
+
+    def coordinator_of(self, device: SoCo) -> Optional[SoCo]:
+        for group in self._groups:
+            if any(member.ip_address == device.ip_address for member in group.members):
+                return group.coordinator
+        return None
+
+    async def run_all(self, devices: List[SoCo], func: Callable, *args) -> Dict[str, str]:
+        """
+        Run func(device, *args) on all devices at once. Returns the outcome per
+        device name; a device still busy at the deadline counts as timed out.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+
+        async def run_one(device: SoCo) -> str:
+            try:
+                # Time spent waiting for the device's lock counts against the deadline
+                await asyncio.wait_for(
+                    async_device(device).run(func, *args, timeout=self.deadline),
+                    max(0.0, deadline - loop.time()),
+                )
+                return OK
+            except (asyncio.TimeoutError, DeviceTimeout):
+                return TIMEOUT
+            except Exception as e:
+                logger.warning(f"{getattr(func, '__name__', func)} failed on {device.ip_address}: {e}")
+                return ERROR
+
+        results = await asyncio.gather(*(run_one(device) for device in devices))
+        return {known_player_name(device): result for device, result in zip(devices, results)}
+
+    async def set_volume(self, coordinators: List[SoCo], volume: int) -> Dict[str, str]:
+        results = await self.run_all(coordinators, _set_group_volume, volume)
+        for coordinator in coordinators:
+            if results[known_player_name(coordinator)] == OK:
+                self._volumes[coordinator.ip_address] = volume
+        return results
+
+    async def pause(self, coordinators: List[SoCo]) -> Dict[str, str]:
+        # Subscribed coordinators tell from their events whether there is anything to pause
+        states = {
+            coordinator.ip_address: device_states.fresh(coordinator, "playback_state")
+            for coordinator in coordinators
+        }
+        playing = [c for c in coordinators if states[c.ip_address] == "PLAYING"]
+        unknown = [c for c in coordinators if states[c.ip_address] is None]
+        results = {
+            known_player_name(c): OK for c in coordinators if states[c.ip_address] not in ("PLAYING", None)
+        }
+        for outcome in await asyncio.gather(
+            self.run_all(playing, _pause_group), self.run_all(unknown, _pause_group_if_playing)
+        ):
+            results.update(outcome)
+        return results
+
+    async def join(self, devices: List[SoCo], coordinator: SoCo) -> Dict[str, str]:
+        """Join devices to a coordinator's group; the topology event updates the groups"""
+        return await self.run_all(devices, _join, coordinator)
+
+    async def unjoin(self, devices: List[SoCo]) -> Dict[str, str]:
+        """Take devices out of their groups; the topology event updates the groups"""
+        return await self.run_all(devices, _unjoin)
+
+
+group_controller = GroupController(deadline=config.GROUP_ACTION_DEADLINE)
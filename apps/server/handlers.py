@@ -1,8 +1,19 @@
 """Action handlers for WebSocket events"""
 import logging
+import config
 from state import StateManager
 from connection import ConnectionManager, Event
-from sonos import play_favorite, get_playable_favorites, discover
+from sonos import play_favorite
+from favorites import favorites_cache
+from device_io import async_device, DeviceTimeout, DEVICE_ERRORS
+from volume import volume_pipeline
+from registry import known_player_name
+from discovery import discovery_engine
+from device_state import device_states
+from subscriptions import subscription_supervisor
+from position import position_engine
+from groups import group_controller, OK
+from queue_loader import queue_loader
 import sys
 
 logger = logging.getLogger(__name__)
@@ -12,26 +23,36 @@ async def handle_active_device(manager: ConnectionManager, ws, state: StateManag
     device_name = data.get("device_name")
     previous_device = state.active_device
     matching_device = next(
-        (d for d in state.devices if d.player_name == device_name), None
+        (d for d in state.devices if known_player_name(d) == device_name), None
     )
     if matching_device:
         state.active_device = matching_device  # Auto-syncs to all clients
 
+        # Kept current by the device's events while it is subscribed, e.g. with warm
+        # subscriptions; goes out in the same batch as the switch
+        volume = device_states.fresh(matching_device, "volume")
+        if volume is not None:
+            state.volume = volume
+        track_info = device_states.fresh(matching_device, "track_info")
+        if track_info is not None:
+            state.track_info = track_info
+        playback_state = device_states.fresh(matching_device, "playback_state")
+        if playback_state is not None:
+            state.playback_state = playback_state
+
         # Update favorites for the new active device
         try:
-            state.favorites = get_playable_favorites(matching_device)
+            state.favorites = await favorites_cache.get(matching_device)
         except Exception as e:
             logger.error(f"Failed to get favorites for {device_name}: {e}")
 
-        # Import here to avoid circular imports
-        from main import _subscribe_to_device_events, _unsubscribe_from_device
-
-        # Unsubscribe from previous device
-        if previous_device and previous_device.player_name != matching_device.player_name:
-            await _unsubscribe_from_device(previous_device.player_name, stop_listener=False)
+        # Unsubscribe from previous device, unless all devices are kept warm
+        if previous_device and previous_device is not matching_device and not config.WARM_SUBSCRIPTIONS:
+            await subscription_supervisor.unwatch(previous_device)
 
-        # Subscribe to new device
-        await _subscribe_to_device_events(matching_device)
+        # Subscribed in the background; events start flowing once it succeeds
+        subscription_supervisor.watch(matching_device)
+        position_engine.track(matching_device, playback_state)
     else:
         await manager.send_event(
             Event(type="error", data={"message": "Device not found"}), ws
@@ -50,7 +71,13 @@ async def handle_play(manager: ConnectionManager, ws, state: StateManager, data:
                 Event(type="error", data={"message": "Favorite not found"}), ws
             )
             return
-        play_favorite(state.active_device, favorite)
+        # Whatever is still loading would end up in the new queue
+        queue_loader.cancel(state.active_device)
+        # Playlists take several SOAP calls (clear, enqueue, play)
+        remaining = await async_device(state.active_device).run(play_favorite, favorite, timeout=15.0)
+        if remaining:
+            # Playback has started with the first batch; queue the rest meanwhile
+            queue_loader.start(state.active_device, remaining)
     else:
         await manager.send_event(
             Event(type="error", data={"message": "No active device or favorite ID"}), ws
@@ -61,25 +88,32 @@ async def handle_volume(manager: ConnectionManager, ws, state: StateManager, dat
     new_volume = data.get("volume")
 
     if isinstance(new_volume, int) and 0 <= new_volume <= 100:
-        state.volume = new_volume  # Auto-syncs to all clients
+        state.volume = new_volume  # Optimistic, auto-syncs to all clients
     else:
         await manager.send_event(
             Event(type="error", data={"message": "Invalid volume"}), ws
         )
+        return
 
     if (state.active_device is None):
         return
-    
-    state.active_device.set_relative_volume(new_volume - state.active_device.volume)   
+
+    # Superseded targets are dropped; only the newest one reaches the speaker
+    volume_pipeline(state.active_device).submit(new_volume)
 
 async def handle_playback_toggle(manager: ConnectionManager, ws, state: StateManager, data: dict):
     """Handle pause action"""
     if state.active_device:
-        info = state.active_device.get_current_transport_info()
-        if info["current_transport_state"] == "PLAYING":
-            return  state.active_device.pause()
+        device = async_device(state.active_device)
+        # Usually from the transport events, saving a round trip
+        if await device_states.playback_state(state.active_device) == "PLAYING":
+            await device.call("pause")
+            playback_state = "PAUSED_PLAYBACK"
         else:
-            state.active_device.play()
+            await device.call("play")
+            playback_state = "PLAYING"
+        # Until the event arrives, so a quick second press toggles back
+        device_states.update(state.active_device, playback_state=playback_state)
 
     else:
         await manager.send_event(
@@ -93,8 +127,117 @@ async def handle_kill(manager: ConnectionManager, ws, state: StateManager, data:
     sys.exit(0)
 
 async def handle_scan_devices(manager: ConnectionManager, ws, state: StateManager, data: dict):
-    devices = list(discover() or [])
-    state.devices = devices
+    """
+    Start a scan in the background; devices are broadcast as they are found.
+    Once it finishes the list is replaced by what it found, dropping rooms that are gone.
+    """
+    def on_found(device):
+        state.add_device(device)
+        if config.WARM_SUBSCRIPTIONS:
+            subscription_supervisor.watch(device)
+
+    def on_finished(task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.warning(f"Device scan failed: {task.exception()}")
+            return
+        devices = sorted(task.result(), key=known_player_name)
+        if [d.ip_address for d in devices] != [d.ip_address for d in state.devices]:
+            state.devices = devices
+
+    discovery_engine.start(on_found).add_done_callback(on_finished)
+
+def _find_device(state: StateManager, device_name):
+    return next((d for d in state.devices if known_player_name(d) == device_name), None)
+
+async def _target_groups(state: StateManager, all_groups: bool):
+    """Coordinators an action applies to: every group, or the active device's one"""
+    if not group_controller.coordinators() and state.devices:
+        await group_controller.refresh(state.active_device or state.devices[0])
+    if all_groups:
+        return group_controller.coordinators()
+    if state.active_device is None:
+        return []
+    coordinator = group_controller.coordinator_of(state.active_device)
+    return [coordinator or state.active_device]
+
+async def _report_group_results(
+    manager: ConnectionManager, ws, state: StateManager, results: dict, update_groups: bool = True
+):
+    """One groups broadcast for the whole action, and one error for the rooms that failed"""
+    if update_groups:
+        state.groups = group_controller.describe()
+    failed = sorted(name for name, result in results.items() if result != OK)
+    if failed:
+        await manager.send_event(
+            Event(type="error", data={"message": f"No response from {', '.join(failed)}"}), ws
+        )
+
+async def handle_group_volume(manager: ConnectionManager, ws, state: StateManager, data: dict):
+    """Set the volume of the active device's group, or of every group"""
+    volume = data.get("volume")
+    if not isinstance(volume, int) or not 0 <= volume <= 100:
+        await manager.send_event(
+            Event(type="error", data={"message": "Invalid volume"}), ws
+        )
+        return
+
+    coordinators = await _target_groups(state, data.get("all", False))
+    results = await group_controller.set_volume(coordinators, volume)
+    await _report_group_results(manager, ws, state, results)
+
+async def handle_group_pause(manager: ConnectionManager, ws, state: StateManager, data: dict):
+    """Pause every group, or only the active device's one"""
+    coordinators = await _target_groups(state, data.get("all", True))
+    results = await group_controller.pause(coordinators)
+    await _report_group_results(manager, ws, state, results)
+
+async def handle_group_join(manager: ConnectionManager, ws, state: StateManager, data: dict):
+    """Join rooms to the group of another room"""
+    coordinator = _find_device(state, data.get("coordinator_name"))
+    names = data.get("device_names") or []
+    devices = [device for device in (_find_device(state, name) for name in names) if device]
+    if not coordinator or not devices or len(devices) != len(names):
+        await manager.send_event(
+            Event(type="error", data={"message": "Device not found"}), ws
+        )
+        return
+
+    results = await group_controller.join(
+        [device for device in devices if device is not coordinator], coordinator
+    )
+    # The cached groups predate the join; the topology event brings the new ones
+    await _report_group_results(manager, ws, state, results, update_groups=False)
+
+async def handle_group_unjoin(manager: ConnectionManager, ws, state: StateManager, data: dict):
+    """Take rooms out of their groups"""
+    names = data.get("device_names") or []
+    devices = [device for device in (_find_device(state, name) for name in names) if device]
+    if not devices or len(devices) != len(names):
+        await manager.send_event(
+            Event(type="error", data={"message": "Device not found"}), ws
+        )
+        return
+
+    results = await group_controller.unjoin(devices)
+    await _report_group_results(manager, ws, state, results, update_groups=False)
+
+async def handle_favorites_sync(manager: ConnectionManager, ws, state: StateManager, data: dict):
+    """
+    Send the favorites to a client unless the hash it already has is current.
+    Before the first fetch there is nothing to send; an empty list would wipe the
+    client's stored copy, and the fetched list is broadcast once it arrives.
+    """
+    if state.favorites_hash is None:
+        return
+    if data.get("hash") != state.favorites_hash:
+        await manager.send_event(state.favorites_full_event(), ws)
+
+async def handle_resume(manager: ConnectionManager, ws, state: StateManager, data: dict):
+    """Replay the state changes a client missed, or send it a snapshot"""
+    since = data.get("since")
+    await state.sync_client(ws, data.get("epoch"), since if isinstance(since, int) else None)
 
 async def dispatch_action(
     action_type: str,
@@ -104,20 +247,43 @@ async def dispatch_action(
     data: dict,
 ):
     """Dispatch action to appropriate handler using match-case"""
-    match action_type:
-        case "active-device":
-            await handle_active_device(manager, ws, state, data)
-        case "play":
-            await handle_play(manager, ws, state, data)
-        case "volume":
-            await handle_volume(manager, ws, state, data)
-        case "playback-toggle":
-            await handle_playback_toggle(manager, ws, state, data)
-        case "kill":
-            await handle_kill(manager, ws, state, data)
-        case "scan-devices":
-            await handle_scan_devices(manager, ws, state, data)
-        case _:
-            await manager.send_event(
-                Event(type="error", data={"message": "Unknown action"}), ws
-            )
+    try:
+        match action_type:
+            case "active-device":
+                await handle_active_device(manager, ws, state, data)
+            case "play":
+                await handle_play(manager, ws, state, data)
+            case "volume":
+                await handle_volume(manager, ws, state, data)
+            case "playback-toggle":
+                await handle_playback_toggle(manager, ws, state, data)
+            case "kill":
+                await handle_kill(manager, ws, state, data)
+            case "scan-devices":
+                await handle_scan_devices(manager, ws, state, data)
+            case "group-volume":
+                await handle_group_volume(manager, ws, state, data)
+            case "group-pause":
+                await handle_group_pause(manager, ws, state, data)
+            case "group-join":
+                await handle_group_join(manager, ws, state, data)
+            case "group-unjoin":
+                await handle_group_unjoin(manager, ws, state, data)
+            case "favorites-sync":
+                await handle_favorites_sync(manager, ws, state, data)
+            case "resume":
+                await handle_resume(manager, ws, state, data)
+            case _:
+                await manager.send_event(
+                    Event(type="error", data={"message": "Unknown action"}), ws
+                )
+    except DeviceTimeout as e:
+        logger.warning(f"Action {action_type} timed out: {e}")
+        await manager.send_event(
+            Event(type="error", data={"message": "Device did not respond"}), ws
+        )
+    except DEVICE_ERRORS as e:
+        logger.warning(f"Action {action_type} failed: {e}")
+        await manager.send_event(
+            Event(type="error", data={"message": "Device could not complete the request"}), ws
+        )
@@ -3,14 +3,31 @@ import logging
 from contextlib import asynccontextmanager
 import soco
 from soco import events_asyncio
-import httpx
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import FileResponse, Response
-from sonos import get_playable_favorites
+from starlette.responses import Response
+import config
+import metrics
+from diagnostics import watchdog, profiler
+from soap_sessions import soap_pool
+from proxy import ImageProxy, image_response
+from static import StaticFiles
+import thumbnails
+from favorites import favorites_cache
+from registry import device_registry, known_player_name
+from discovery import discovery_engine
+import device_io
+from device_io import DeviceTimeout, DEVICE_ERRORS
 from state import StateManager
-from connection import ConnectionManager, Action
+from connection import ConnectionManager
+import codec as wire
 from handlers import dispatch_action
+from volume import volume_pipeline
+from device_state import device_states
+from transport_events import transport_processor
+from subscriptions import subscription_supervisor
+from position import position_engine
+from groups import group_controller
 from connection import Event
 
 # Configure logging
@@ -19,226 +36,202 @@ logger = logging.getLogger(__name__)
 
 # Set up SoCo async events
 soco.config.EVENTS_MODULE = events_asyncio
+soco.config.REQUEST_TIMEOUT = config.SOCO_REQUEST_TIMEOUT
+# Keep-alive connections for SOAP calls
+soap_pool.install()
 
 # Global state
 manager: ConnectionManager | None = None
 state: StateManager | None = None
-subscriptions: dict = {}
-subscriptions_lock = asyncio.Lock()
+image_proxy: ImageProxy | None = None
+static_files: StaticFiles | None = None
 
-# Subscription retry configuration
-MAX_SUBSCRIPTION_RETRIES = 3
-SUBSCRIPTION_RETRY_BASE_DELAY = 2.0
 
-async def _discover_devices_async() -> list:
-    """Discover Sonos devices in thread pool to avoid blocking"""
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, lambda: list(soco.discover() or []))
+def _device_event_callbacks(device) -> dict:
+    """
+    Event handlers for one device, keyed like subscriptions.SERVICES.
+    Events are broadcast to all connected clients.
+    """
+    device_name = known_player_name(device)
 
+    def on_rendering_event(event):
+        """Handle rendering control events (volume, mute, etc)"""
+        try:
+            if not state or not manager:
+                return
+
+            logger.info(f"Received rendering event from {device_name}: {event.variables}")
+
+            if "volume" in event.variables:
+                volume = event.variables.get("volume", {}).get("Master")
+                if volume is not None:
+                    logger.debug(f"Volume event from {device_name}: {volume}")
+                    device_states.update(device, volume=int(volume))
+                    # Skip echoes of targets a newer slider value has replaced
+                    if volume_pipeline(device).accept_event(int(volume)) and state.active_device == device:
+                        state.volume = int(volume)
+        except Exception as e:
+            logger.error(f"Error handling rendering event from {device_name}: {e}")
 
-async def _unsubscribe_from_device(device_name: str, stop_listener: bool = False) -> None:
-    """Unsubscribe from a single device's event streams."""
-    async with subscriptions_lock:
-        subs = subscriptions.pop(device_name, None)
+    def on_transport_event(event):
+        """Handle transport events (play, pause, track change, etc)"""
+        try:
+            if not state or not manager:
+                return
+
+            track_info, transport_state = transport_processor.process(device, event.variables)
+            if transport_state is None:
+                # Not part of this event; the speaker's state did not change
+                device_states.update(device, track_info=track_info)
+                cached = device_states.get(device)
+                transport_state = cached.playback_state if cached else None
+            else:
+                # Also when unchanged: it confirms the cached values are current
+                device_states.update(device, track_info=track_info, playback_state=transport_state)
+            if state.active_device != device:
+                return
+
+            # Assigning broadcasts, so only touch what actually changed
+            if state.track_info != track_info:
+                state.track_info = track_info
+            if transport_state is not None and state.playback_state != transport_state:
+                state.playback_state = transport_state
+            position_engine.on_transport(device, event.variables, transport_state)
 
-    if not subs:
-        return
+        except Exception as e:
+            logger.error(f"Error handling transport event from {device_name}: {e}")
 
-    try:
-        logger.info(f"Unsubscribing from {device_name}")
-        await subs["rendering"].unsubscribe()
-        await subs["transport"].unsubscribe()
-    except Exception as e:
-        logger.error(f"Error unsubscribing from {device_name}: {e}")
+    async def _refresh_favorites():
+        try:
+            favorites = await favorites_cache.get(device)
+            if state and state.active_device == device:
+                state.favorites = favorites
+        except Exception as e:
+            logger.error(f"Failed to refresh favorites for {device_name}: {e}")
 
-    if not stop_listener or subscriptions:
-        # Only stop event listener when explicitly requested and no subscriptions remain
-        return
+    def on_content_directory_event(event):
+        """Handle content directory events; only favorites changes matter"""
+        try:
+            if favorites_cache.handle_event(device, event.variables):
+                asyncio.create_task(_refresh_favorites())
+        except Exception as e:
+            logger.error(f"Error handling content directory event from {device_name}: {e}")
 
-    try:
-        await events_asyncio.event_listener.async_stop()
-        logger.info("Event listener stopped")
-    except Exception as e:
-        logger.error(f"Error stopping event listener: {e}")
+    async def _refresh_topology():
+        try:
+            devices = await device_registry.handle_topology_event(device)
+            if devices is not None and state:
+                state.devices = devices
+                state.groups = await group_controller.refresh(device)
+                if config.WARM_SUBSCRIPTIONS:
+                    _watch_devices(devices)
+        except Exception as e:
+            logger.error(f"Failed to update device registry from {device_name}: {e}")
 
+    def on_topology_event(event):
+        """Handle zone group topology events (rooms renamed, added, grouped)"""
+        if "zone_group_state" in event.variables:
+            asyncio.create_task(_refresh_topology())
 
-async def _subscribe_to_device_events(device) -> None:
-    """
-    Subscribe to a device's rendering and transport events.
-    Events are broadcast to all connected clients.
-    Includes retry logic with exponential backoff.
-    """
-    device_name = device.player_name
+    return {
+        "rendering": on_rendering_event,
+        "transport": on_transport_event,
+        "content_directory": on_content_directory_event,
+        "topology": on_topology_event,
+    }
 
-    for attempt in range(MAX_SUBSCRIPTION_RETRIES):
-        try:
-            # Check if already subscribed
-            async with subscriptions_lock:
-                if device_name in subscriptions:
-                    logger.info(f"Already subscribed to {device_name}")
-                    return
-
-            logger.info(f"Subscribing to {device_name} (attempt {attempt + 1}/{MAX_SUBSCRIPTION_RETRIES})")
-
-            sub_rendering = await device.renderingControl.subscribe()
-            sub_transport = await device.avTransport.subscribe()
-
-            def on_rendering_event(event):
-                """Handle rendering control events (volume, mute, etc)"""
-                try:
-                    if not state or not manager:
-                        return
-                    
-                    logger.info(f"Received rendering event from {device_name}: {event.variables}")
-
-                    if "volume" in event.variables:
-                        volume = event.variables.get("volume", {}).get("Master")
-                        if volume is not None:
-                            logger.debug(f"Volume event from {device_name}: {volume}")
-                            state.volume = int(volume)
-                except Exception as e:
-                    logger.error(f"Error handling rendering event from {device_name}: {e}")
-
-            def on_transport_event(event):
-                """Handle transport events (play, pause, track change, etc)"""
-                try:
-                    if not state or not manager or state.active_device != device:
-                        return
-
-                    title = None
-                    artist = None
-                    album_art = None
-
-                    metadata = event.variables.get("current_track_meta_data")
-                    enqueued_metadata = event.variables.get("enqueued_transport_uri_meta_data")
-                    transport_state = event.variables.get("transport_state")
-
-                    if metadata and hasattr(metadata, "title") and hasattr(metadata, "creator"):
-                        title = metadata.title
-                        artist = metadata.creator
-
-                        if hasattr(metadata, "album_art_uri") and metadata.album_art_uri:
-                            try:
-                                album_art = state.active_device.music_library.build_album_art_full_uri(
-                                    metadata.album_art_uri
-                                )
-                            except Exception as e:
-                                logger.debug(f"Failed to build album art URI: {e}")
-
-                    elif enqueued_metadata and hasattr(enqueued_metadata, "title") and enqueued_metadata.title:
-                        if metadata and hasattr(metadata, "stream_content"):
-                            title = metadata.stream_content
-                        else:
-                            title = enqueued_metadata.title
-
-                        artist = enqueued_metadata.title
-
-                        if metadata and hasattr(metadata, "album_art_uri") and metadata.album_art_uri:
-                            try:
-                                album_art = state.active_device.music_library.build_album_art_full_uri(
-                                    metadata.album_art_uri
-                                )
-                            except Exception as e:
-                                logger.debug(f"Failed to build album art URI for radio: {e}")
-
-                    track_info = {
-                        "title": title,
-                        "artist": artist,
-                        "album_art": album_art,
-                    }
-
-                    state.track_info = track_info
-                    state.playback_state = transport_state
-
-                except Exception as e:
-                    logger.error(f"Error handling transport event from {device_name}: {e}")
-
-            sub_rendering.callback = on_rendering_event
-            sub_transport.callback = on_transport_event
-
-            async with subscriptions_lock:
-                subscriptions[device_name] = {
-                    "rendering": sub_rendering,
-                    "transport": sub_transport,
-                }
-
-            logger.info(f"Successfully subscribed to {device_name}")
-            return
 
-        except Exception as e:
-            logger.warning(f"Subscription attempt {attempt + 1} failed for {device_name}: {e}")
+subscription_supervisor.callbacks = _device_event_callbacks
 
-            if attempt < MAX_SUBSCRIPTION_RETRIES - 1:
-                delay = SUBSCRIPTION_RETRY_BASE_DELAY * (2 ** attempt)
-                logger.info(f"Retrying in {delay}s...")
-                await asyncio.sleep(delay)
-            else:
-                logger.error(f"Failed to subscribe to {device_name} after {MAX_SUBSCRIPTION_RETRIES} attempts")
 
+def _publish_position(anchor) -> None:
+    if state:
+        state.position = anchor
 
-async def _unsubscribe_from_all_devices(stop_listener: bool = True) -> None:
-    """Unsubscribe from all device events and optionally stop event listener"""
-    async with subscriptions_lock:
-        items = list(subscriptions.items())
-        subscriptions.clear()
 
-    # Unsubscribe with timeout to prevent hanging during shutdown
-    for device_name, subs in items:
-        try:
-            await asyncio.wait_for(
-                asyncio.gather(
-                    subs["rendering"].unsubscribe(),
-                    subs["transport"].unsubscribe(),
-                    return_exceptions=True
-                ),
-                timeout=2.0
-            )
-        except asyncio.TimeoutError:
-            pass  # Silently skip on timeout during shutdown
-        except Exception:
-            pass  # Suppress all exceptions during shutdown
-
-    if not stop_listener:
-        return
+position_engine.listener = _publish_position
 
+
+def _watch_devices(devices) -> None:
+    """Keep every device subscribed, so their state stays warm for instant switching"""
+    for device in devices:
+        subscription_supervisor.watch(device)
+
+
+async def _refresh_devices() -> None:
+    """Verify the registry and discover new devices without holding up startup"""
     try:
-        await asyncio.wait_for(
-            events_asyncio.event_listener.async_stop(),
-            timeout=3.0
-        )
-    except (asyncio.TimeoutError, Exception):
-        pass  # Suppress all exceptions during shutdown
+        devices = await device_registry.refresh()
+        state.devices = devices
+        logger.info(f"Discovered {len(devices)} device(s)")
+        if not devices:
+            # Multicast may be filtered on this network; sweep the subnet instead
+            await discovery_engine.start(state.add_device)
+        if config.WARM_SUBSCRIPTIONS:
+            _watch_devices(state.devices)
+        if devices:
+            state.groups = await group_controller.refresh(devices[0])
+    except Exception as e:
+        logger.error(f"Error during device discovery: {e}")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global manager, state
+    global manager, state, image_proxy, static_files
     
     # Startup
     logger.info("Starting TuneHub server...")
-    manager = ConnectionManager()
-    state = StateManager(manager)
-    
-    # Discover devices and subscribe to events
-    try:
-        devices = await _discover_devices_async()
-        state.devices = devices
-        # state.active_device = devices[0] if devices else None
-        
-        logger.info(f"Discovered {len(devices)} device(s)")
-    except Exception as e:
-        logger.error(f"Error during startup: {e}")
+    watchdog.start()
+    manager = ConnectionManager(
+        max_queue=config.WS_SEND_QUEUE_SIZE,
+        slow_client_policy=config.WS_SLOW_CLIENT_POLICY,
+    )
+    state = StateManager(
+        manager,
+        flush_interval=config.SYNC_FLUSH_INTERVAL,
+        history_size=config.SYNC_HISTORY_SIZE,
+    )
+    image_proxy = ImageProxy(
+        cache_dir=config.PROXY_CACHE_DIR,
+        memory_bytes=config.PROXY_MEMORY_CACHE_BYTES,
+        disk_bytes=config.PROXY_DISK_CACHE_BYTES,
+        revalidate_after=config.PROXY_REVALIDATE_AFTER,
+        timeout=config.PROXY_TIMEOUT,
+        max_connections=config.PROXY_MAX_CONNECTIONS,
+        placeholder_path=config.PROXY_PLACEHOLDER_PATH,
+    )
+    static_files = StaticFiles(
+        root=config.STATIC_DIR,
+        memory_bytes=config.STATIC_MEMORY_BYTES,
+        memory_max_file=config.STATIC_MEMORY_MAX_FILE,
+    )
+    await asyncio.to_thread(static_files.scan)
     
+    await favorites_cache.load()
+
+    # Serve the known devices right away; discovery only confirms them
+    await device_registry.load()
+    state.devices = device_registry.devices()
+    refresh_task = asyncio.create_task(_refresh_devices())
+
     yield
+
+    refresh_task.cancel()
     
     print("Shutting down TuneHub server...", flush=True)
     try:
-        await asyncio.wait_for(_unsubscribe_from_all_devices(), timeout=5.0)
+        await asyncio.wait_for(subscription_supervisor.unwatch_all(), timeout=5.0)
         print("Shutdown complete", flush=True)
     except asyncio.TimeoutError:
         print("Shutdown timed out, forcing exit", flush=True)
     except Exception:
         pass
 
+    await image_proxy.aclose()
+    device_io.executor.shutdown()
+    soap_pool.close()
+    watchdog.stop()
+
 
 app = FastAPI(title="TuneHub", lifespan=lifespan)
 
@@ -253,28 +246,48 @@ app.add_middleware(
 
 
 @app.websocket("/ws")
-async def websocket_endpoint(ws: WebSocket):
+async def websocket_endpoint(
+    ws: WebSocket,
+    epoch: str | None = Query(None, description="Server epoch from the client's last session"),
+    since: int | None = Query(None, description="Last sequence number the client received"),
+    codec: str | None = Query(None, description="Wire format: json (default) or msgpack"),
+    deflate: bool = Query(False, description="Compress large messages with zlib"),
+):
     """WebSocket endpoint for real-time Sonos control"""
     if not manager or not state:
         await ws.close(code=1008, reason="Server not initialized")
         return
     
-    await manager.connect(ws)
+    client_codec, subprotocol = wire.negotiate(
+        codec, deflate, ws.scope.get("subprotocols", []), config.WS_DEFLATE_MIN_BYTES
+    )
+    await manager.connect(ws, client_codec, subprotocol)
     logger.info(f"Client connected. Active connections: {len(manager.active_connections)}")
 
+    # Only this client: a snapshot, or just the changes it missed while away.
+    # Queued before any later broadcast, so the client sees changes in order.
+    await state.sync_client(ws, epoch, since)
+
     if state.active_device:
-        state.favorites = get_playable_favorites(state.active_device)
-        state.playback_state = state.active_device.get_current_transport_info().get("current_transport_state") 
-        await _subscribe_to_device_events(state.active_device)
+        try:
+            # Assigning broadcasts to every client, so only touch what actually changed
+            favorites = await favorites_cache.get(state.active_device)
+            if state.favorites != favorites:
+                state.favorites = favorites
+            # From events when subscribed, e.g. another client is connected
+            playback_state = await device_states.playback_state(state.active_device)
+            if state.playback_state != playback_state:
+                state.playback_state = playback_state
+        except (DeviceTimeout, *DEVICE_ERRORS) as e:
+            # The client is connected either way; it can pick another device
+            logger.warning(f"Active device did not respond on connect: {e}")
+        subscription_supervisor.watch(state.active_device)
+        position_engine.track(state.active_device, state.playback_state or None)
 
     try:
-        # Sync current state to new client (including cached track info)
-        await state.sync_all()
-
         # Main message loop
         while True:
-            msg = await ws.receive_json()
-            action = Action(**msg)
+            action = await manager.receive_action(ws)
             logger.debug(f"Received action: {action.type}")
             await dispatch_action(action.type, manager, ws, state, action.data)
 
@@ -282,55 +295,105 @@ async def websocket_endpoint(ws: WebSocket):
         manager.disconnect(ws)
         logger.info(f"Client disconnected. Active connections: {len(manager.active_connections)}")
 
-        # Cleanup subscriptions when last client disconnects
         if not manager.active_connections:
+            # Nobody to show a position to; stop reading it
+            position_engine.untrack()
+
+        # Cleanup subscriptions when last client disconnects, unless they are kept warm
+        if not manager.active_connections and not config.WARM_SUBSCRIPTIONS:
             logger.info("Last client disconnected, unsubscribing from all devices")
-            await _unsubscribe_from_all_devices(stop_listener=True)
+            await subscription_supervisor.unwatch_all(stop_listener=True)
 
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
         manager.disconnect(ws)
 
 
+metrics.registry.gauge(
+    "tunehub_ws_connections", "Connected websocket clients",
+    callback=lambda: len(manager.active_connections) if manager else 0,
+)
+metrics.registry.gauge(
+    "tunehub_sync_pending_keys", "State keys changed but not yet broadcast",
+    callback=lambda: state.pending_sync if state else 0,
+)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics"""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/debug/profile")
+async def profile(
+    seconds: float = Query(10.0, gt=0, le=config.PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(5.0, ge=1, le=100, description="Milliseconds between samples"),
+):
+    """Sample all threads for a while and return collapsed stacks for flamegraph.pl or speedscope"""
+    if profiler.busy:
+        return Response(status_code=409, content="A profile is already running")
+    collapsed = await profiler.profile(seconds, interval_ms / 1000)
+    return Response(
+        content=collapsed,
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="tunehub.collapsed"'},
+    )
+
+
+@app.get("/debug/connections")
+async def connection_stats():
+    """Outbound queue depth and drop counts per websocket client"""
+    if not manager:
+        return Response(status_code=503)
+    return manager.stats()
+
+
+@app.get("/debug/subscriptions")
+async def subscription_health():
+    """Subscription status, renewal deadline and last event per device"""
+    return subscription_supervisor.health()
+
+
 @app.get("/proxy")
-async def proxy_image(url: str = Query(..., description="URL to proxy")):
-    """Proxy endpoint for cover art and images from Sonos devices"""
+async def proxy_image(
+    request: Request,
+    url: str = Query(..., description="URL to proxy"),
+    w: int | None = Query(None, ge=1, description="Target width in pixels"),
+    h: int | None = Query(None, ge=1, description="Target height in pixels"),
+    format: str = Query(thumbnails.DEFAULT_FORMAT, pattern="^(jpeg|webp)$"),
+):
+    """Proxy endpoint for cover art and images from Sonos devices, optionally downscaled"""
+    if not image_proxy:
+        return Response(status_code=503)
+
+    size = thumbnails.normalize_size(w, h)
     try:
         if not url.startswith(("http://", "https://")):
             raise ValueError("Invalid URL scheme")
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            
-            content_type = response.headers.get("content-type", "application/octet-stream")
-            
-            return Response(
-                content=response.content,
-                media_type=content_type,
-                headers={
-                    "Cache-Control": "public, max-age=3600",
-                    "Access-Control-Allow-Origin": "*"
-                }
-            )
+
+        if size:
+            image = await image_proxy.fetch_variant(url, size, format)
+            return image_response(image, request.headers.get("if-none-match"))
+
+        image = await image_proxy.fetch(url)
     except Exception as e:
         logger.warning(f"Proxy request failed for {url}: {e}")
         # Fallback to empty placeholder
-        try:
-            with open("./assets/empty.png", "rb") as f:
-                return Response(
-                    content=f.read(),
-                    media_type="image/png",
-                    headers={
-                        "Cache-Control": "public, max-age=3600",
-                        "Access-Control-Allow-Origin": "*"
-                    }
-                )
-        except Exception:
+        image = image_proxy.placeholder
+        if image is None:
             return Response(status_code=404)
 
+    return image_response(image, request.headers.get("if-none-match"))
+
 
 @app.get("/{full_path:path}")
-async def root():
-    """Serve frontend index.html"""
-    return FileResponse('index.html')
\ No newline at end of file
+async def frontend(request: Request, full_path: str):
+    """Serve the UI: its static files, and index.html for client-side routes"""
+    if not static_files:
+        return Response(status_code=503)
+    return static_files.response(
+        full_path,
+        request.headers.get("accept-encoding"),
+        request.headers.get("if-none-match"),
+    )
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+Minimal Prometheus metrics, cheap enough to stay enabled on a Pi.
+
+Recording is a dict lookup and an addition; updates happen on the event loop,
+so no locking is needed. Metrics updated from worker threads are wrapped in
+ThreadSafe. Rendering to the text exposition format only happens when /metrics
+is scraped.
+"""
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; covers fast local calls up to SOAP timeouts
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge:
+    """A value that is set directly, or read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        callback: Optional[Callable[[], float]] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.callback = callback
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                return [f"{self.name} {_format_value(self.callback())}"]
+            except Exception:
+                return []
+        return [
+            f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., overflow], sum
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *labels: str):
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        bucket_labels = self.labels + ("le",)
+        for labels, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = _format_value(bound)
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(bucket_labels, labels + (le,))} {cumulative}"
+                )
+            label_text = _format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(self._sums[labels])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class ThreadSafe:
+    """A metric recorded from worker threads; updates and scrapes share one lock"""
+
+    def __init__(self, metric):
+        self.metric = metric
+        self.name = metric.name
+        self.documentation = metric.documentation
+        self.kind = metric.kind
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self.metric.inc(*labels, amount=amount)
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            self.metric.observe(value, *labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return self.metric.samples()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labels, callback))
+
+    def histogram(
+        self, name: str, documentation: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+
+soco_call_seconds = registry.histogram(
+    "tunehub_soco_call_seconds", "Duration of blocking SoCo calls", ["method", "device"]
+)
+soco_call_timeouts = registry.counter(
+    "tunehub_soco_call_timeouts_total", "SoCo calls abandoned after the device I/O timeout", ["method", "device"]
+)
+gena_events = registry.counter(
+    "tunehub_gena_events_total", "UPnP events received", ["service"]
+)
+broadcast_seconds = registry.histogram(
+    "tunehub_broadcast_seconds", "Time to encode and enqueue one broadcast for all clients",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+broadcast_messages = registry.counter(
+    "tunehub_broadcast_messages_total", "Messages handed to client queues by broadcasts"
+)
+send_failures = registry.counter(
+    "tunehub_ws_send_failures_total", "Websocket messages that were dropped or failed to send", ["reason"]
+)
+proxy_requests = registry.counter(
+    "tunehub_proxy_requests_total", "Image proxy lookups by where they were answered from", ["result"]
+)
+proxy_upstream_seconds = registry.histogram(
+    "tunehub_proxy_upstream_seconds", "Duration of image requests to speakers and services", ["status"]
+)
@@ -0,0 +1,222 @@
+"""Playback position of the active device, sent as anchors that clients interpolate"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from soco import SoCo
+
+import config
+import metrics
+from device_io import async_device
+
+logger = logging.getLogger(__name__)
+
+position_resyncs = metrics.registry.counter(
+    "tunehub_position_resyncs_total", "Position reads from the active device, by cause", ["reason"]
+)
+
+
+def parse_duration(value) -> Optional[float]:
+    """Seconds from a UPnP H:MM:SS time; None for streams and NOT_IMPLEMENTED"""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        hours, minutes, seconds = value.split(":")
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        return None
+
+
+@dataclass
+class PositionAnchor:
+    """Where playback was at a point in time on the server's monotonic clock"""
+    position: float
+    duration: Optional[float]
+    playing: bool
+    anchored_at: float
+    rate: float = 1.0
+
+    def at(self, now: float) -> float:
+        """The position this anchor predicts for the given time.monotonic()"""
+        position = self.position
+        if self.playing:
+            position += (now - self.anchored_at) * self.rate
+        if self.duration:
+            position = min(position, self.duration)
+        return position
+
+    def event_data(self, now: float) -> dict:
+        # Clients add (server_time - anchored_at) * rate and continue on their own clock
+        return {
+            "position": self.position,
+            "duration": self.duration,
+            "playing": self.playing,
+            "rate": self.rate if self.playing else 0.0,
+            "anchored_at": self.anchored_at,
+            "server_time": now,
+        }
+
+
+class PositionEngine:
+    """
+    Follows the active device without polling it. Duration and play state come from
+    transport events; the position itself is read once after a track change, a pause,
+    a seek (which shows up as a transport change) or switching devices. While playing,
+    a read every drift_check_interval compares the speaker with the anchor, and a new
+    anchor is only sent when they differ by more than drift_tolerance.
+    """
+
+    def __init__(self, drift_tolerance: float, drift_check_interval: float):
+        self.drift_tolerance = drift_tolerance
+        self.drift_check_interval = drift_check_interval
+        # Called with each new anchor, or None when there is nothing to show
+        self.listener: Optional[Callable[[Optional[PositionAnchor]], None]] = None
+        self.device: Optional[SoCo] = None
+        self.anchor: Optional[PositionAnchor] = None
+        self._track_key: Optional[tuple] = None
+        self._transport_state: Optional[str] = None
+        self._duration: Optional[float] = None
+        self._resync_reason: Optional[str] = None
+        self._resync_task: Optional[asyncio.Task] = None
+        self._drift_task: Optional[asyncio.Task] = None
+
+    @property
+    def playing(self) -> bool:
+        return self._transport_state == "PLAYING"
+
+    def track(self, device: SoCo, transport_state: Optional[str] = None):
+        """Follow a newly selected device; reads its position once its play state is known"""
+        if device is self.device:
+            return
+        self.untrack()
+        self.device = device
+        self._transport_state = transport_state
+        if transport_state is not None:
+            self._request_resync("device")
+        # Otherwise the initial event of the new subscription brings the play state
+
+    def untrack(self):
+        self.device = None
+        self._track_key = None
+        self._transport_state = None
+        self._duration = None
+        self._stop_drift_checks()
+        self._publish(None)
+
+    def on_transport(self, device: SoCo, variables: dict, transport_state: Optional[str]):
+        """Feed a transport event of any device; only the followed one is considered"""
+        if device is not self.device or transport_state == "TRANSITIONING":
+            # Transitions are followed by the state the speaker ends up in
+            return
+
+        track_key = (variables.get("current_track_uri"), variables.get("current_track"))
+        duration = parse_duration(variables.get("current_track_duration"))
+        if duration is not None:
+            self._duration = duration
+
+        if track_key != self._track_key and track_key != (None, None):
+            self._track_key = track_key
+            self._transport_state = transport_state
+            self._request_resync("track")
+        elif transport_state is not None and transport_state != self._transport_state:
+            previous_anchor = self.anchor
+            self._transport_state = transport_state
+            if previous_anchor and not self.playing:
+                # Freeze where the anchor says we are; the read corrects it if needed
+                now = time.monotonic()
+                self._publish(PositionAnchor(
+                    position=previous_anchor.at(now),
+                    duration=self._duration,
+                    playing=False,
+                    anchored_at=now,
+                ))
+            self._request_resync("transport")
+        elif self.anchor and duration is not None and self.anchor.duration != duration:
+            self.anchor.duration = duration
+            self._publish(self.anchor)
+
+    def _request_resync(self, reason: str):
+        """Read the position soon; requests arriving meanwhile share one read"""
+        self._resync_reason = reason
+        if self._resync_task and not self._resync_task.done():
+            return
+        self._resync_task = asyncio.create_task(self._run_resyncs())
+
+    async def _run_resyncs(self):
+        while self._resync_reason is not None:
+            reason = self._resync_reason
+            self._resync_reason = None
+            anchor = await self._read(reason)
+            if anchor is not None:
+                self._publish(anchor)
+
+        if self.playing and self.drift_check_interval > 0:
+            self._start_drift_checks()
+        else:
+            self._stop_drift_checks()
+
+    async def _read(self, reason: str) -> Optional[PositionAnchor]:
+        device = self.device
+        if device is None:
+            return None
+
+        position_resyncs.inc(reason)
+        started = time.monotonic()
+        try:
+            info = await async_device(device).call("get_current_track_info")
+        except Exception as e:
+            logger.debug(f"Failed to read position of {device.ip_address}: {e}")
+            return None
+        if device is not self.device:
+            # Switched devices while reading
+            return None
+
+        position = parse_duration(info.get("position")) or 0.0
+        duration = parse_duration(info.get("duration")) or self._duration
+        self._duration = duration
+        return PositionAnchor(
+            position=position,
+            duration=duration,
+            playing=self.playing,
+            # The speaker answered somewhere within the round trip; assume halfway
+            anchored_at=(started + time.monotonic()) / 2,
+        )
+
+    def _start_drift_checks(self):
+        if self._drift_task and not self._drift_task.done():
+            return
+        self._drift_task = asyncio.create_task(self._check_drift())
+
+    def _stop_drift_checks(self):
+        if self._drift_task and self._drift_task is not asyncio.current_task():
+            self._drift_task.cancel()
+        self._drift_task = None
+
+    async def _check_drift(self):
+        while self.playing:
+            await asyncio.sleep(self.drift_check_interval)
+            if self._resync_task and not self._resync_task.done():
+                continue
+
+            anchor = await self._read("drift")
+            if anchor is None or self.anchor is None:
+                continue
+            drift = abs(self.anchor.at(anchor.anchored_at) - anchor.position)
+            if drift > self.drift_tolerance:
+                logger.debug(f"Position drifted by {drift:.2f}s, resyncing")
+                self._publish(anchor)
+
+    def _publish(self, anchor: Optional[PositionAnchor]):
+        if anchor is None and self.anchor is None:
+            return
+        self.anchor = anchor
+        if self.listener:
+            self.listener(anchor)
+
+
+position_engine = PositionEngine(
+    drift_tolerance=config.POSITION_DRIFT_TOLERANCE,
+    drift_check_interval=config.POSITION_DRIFT_CHECK_INTERVAL,
+)
@@ -0,0 +1,409 @@
+"""Album art proxy with a pooled upstream client and a two-level cache"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from starlette.responses import Response
+
+import metrics
+import thumbnails
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# Also for variants: their URL stays the same when the art behind it changes,
+# and without Pillow or on a failed resize they are the source image itself
+CACHE_CONTROL = "public, max-age=3600"
+
+
+@dataclass
+class CachedImage:
+    content: bytes
+    content_type: str
+    digest: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    checked_at: float = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self.content)
+
+
+def url_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """LRU of images bounded by total content size"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._items: "OrderedDict[str, CachedImage]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[CachedImage]:
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+        return item
+
+    def put(self, key: str, item: CachedImage):
+        if item.size > self.max_bytes:
+            return
+        self.discard(key)
+        self._items[key] = item
+        self.total_bytes += item.size
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.total_bytes -= evicted.size
+
+    def discard(self, key: str):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.total_bytes -= item.size
+
+
+class DiskCache:
+    """
+    Content-addressed image store.
+    Blobs are stored once by content digest; a small index file per URL points at the blob.
+    Both count towards max_bytes.
+    Blocking file I/O, call through asyncio.to_thread; writes are serialized so
+    concurrent fetches keep the byte count in line with the disk.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._blob_dir = os.path.join(root, "blobs")
+        self._index_dir = os.path.join(root, "index")
+        self._total_bytes: Optional[int] = None
+        # Reentrant: put rewrites the index through touch
+        self._lock = threading.RLock()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self._blob_dir, digest[:2], digest)
+
+    def _index_path(self, key: str) -> str:
+        return os.path.join(self._index_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[CachedImage]:
+        index_path = self._index_path(key)
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            with open(self._blob_path(meta["digest"]), "rb") as f:
+                content = f.read()
+        except (OSError, KeyError, TypeError):
+            # Blob evicted or entry unreadable; the entry would never hit again
+            with self._lock:
+                self._remove(index_path)
+            return None
+        return CachedImage(content=content, **meta)
+
+    def put(self, key: str, item: CachedImage):
+        if item.size > self.max_bytes:
+            return
+        try:
+            with self._lock:
+                blob_path = self._blob_path(item.digest)
+                if not os.path.exists(blob_path):
+                    _atomic_write(blob_path, item.content)
+                    self._add_bytes(item.size)
+                else:
+                    os.utime(blob_path)
+                self.touch(key, item)
+                self._evict()
+        except OSError as e:
+            logger.warning(f"Failed to write image cache entry: {e}")
+
+    def touch(self, key: str, item: CachedImage):
+        """Rewrite the index entry, e.g. after a successful revalidation"""
+        meta = asdict(item)
+        meta.pop("content")
+        content = json.dumps(meta).encode("utf-8")
+        index_path = self._index_path(key)
+        try:
+            with self._lock:
+                previous = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+                _atomic_write(index_path, content)
+                self._add_bytes(len(content) - previous)
+        except OSError as e:
+            logger.warning(f"Failed to write image cache index: {e}")
+
+    def _add_bytes(self, size: int):
+        if self._total_bytes is None:
+            # The first scan already includes the file just written
+            self._total_bytes = sum(
+                size for directory in (self._blob_dir, self._index_dir) for _, size, _ in self._files(directory)
+            )
+        else:
+            self._total_bytes += size
+
+    def _files(self, directory: str):
+        for root, _, files in os.walk(directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _remove(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        if self._total_bytes is not None:
+            self._total_bytes -= size
+
+    def _evict(self):
+        """Remove least recently written blobs and the index entries pointing at them until the store fits"""
+        if self._total_bytes is None or self._total_bytes <= self.max_bytes:
+            return
+
+        evicted = set()
+        for path, size, _ in sorted(self._files(self._blob_dir), key=lambda blob: blob[2]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self._total_bytes -= size
+                evicted.add(os.path.basename(path))
+            except OSError:
+                pass
+        if not evicted:
+            return
+
+        for path, _, _ in list(self._files(self._index_dir)):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    digest = json.load(f).get("digest")
+            except (OSError, ValueError, AttributeError):
+                digest = None
+            if digest is None or digest in evicted:
+                self._remove(path)
+
+
+def _atomic_write(path: str, content: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+class ImageProxy:
+    """
+    Fetches images from speakers through one long-lived connection pool.
+    Concurrent requests for the same URL share a single upstream fetch, and
+    cached images are revalidated with ETag/Last-Modified once they get old.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        memory_bytes: int,
+        disk_bytes: int,
+        revalidate_after: float,
+        timeout: float,
+        max_connections: int,
+        placeholder_path: Optional[str] = None,
+    ):
+        self.revalidate_after = revalidate_after
+        self.memory = MemoryCache(memory_bytes)
+        self.disk = DiskCache(cache_dir, disk_bytes)
+        self._timeout = timeout
+        self._max_connections = max_connections
+        self._client: Optional["httpx.AsyncClient"] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.placeholder = _load_placeholder(placeholder_path)
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            # Imported on first use; only the proxy needs it, and it slows down startup
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                timeout=self._timeout,
+                limits=httpx.Limits(
+                    max_connections=self._max_connections,
+                    max_keepalive_connections=self._max_connections,
+                ),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _is_fresh(self, item: CachedImage) -> bool:
+        return time.time() - item.checked_at < self.revalidate_after
+
+    async def fetch(self, url: str) -> CachedImage:
+        """Get an image, coalescing concurrent requests for the same URL"""
+        key = url_key(url)
+        item = self.memory.get(key)
+        if item is not None and self._is_fresh(item):
+            metrics.proxy_requests.inc("memory")
+            return item
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, url, item))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # Shield so a client going away does not cancel the shared fetch
+        return await asyncio.shield(task)
+
+    async def fetch_variant(self, url: str, size: Tuple[int, int], fmt: str) -> CachedImage:
+        """Get a downscaled variant of an image, rendering it at most once per source image"""
+        source = await self.fetch(url)
+        if not thumbnails.is_available():
+            return source
+
+        width, height = size
+        key = url_key(f"{source.digest}:{width}x{height}:{fmt}")
+        item = self.memory.get(key)
+        if item is not None:
+            metrics.proxy_requests.inc("variant_memory")
+            return item
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load_variant(key, source, size, fmt))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        return await asyncio.shield(task)
+
+    async def _load_variant(
+        self, key: str, source: CachedImage, size: Tuple[int, int], fmt: str
+    ) -> CachedImage:
+        item = await asyncio.to_thread(self.disk.get, key)
+        if item is not None:
+            metrics.proxy_requests.inc("variant_disk")
+        else:
+            metrics.proxy_requests.inc("variant_rendered")
+            try:
+                content, content_type = await asyncio.to_thread(
+                    thumbnails.resize_image, source.content, size, fmt
+                )
+            except Exception as e:
+                logger.warning(f"Failed to resize image: {e}")
+                return source
+
+            item = CachedImage(
+                content=content,
+                content_type=content_type,
+                digest=hashlib.sha256(content).hexdigest(),
+                checked_at=time.time(),
+            )
+            await asyncio.to_thread(self.disk.put, key, item)
+
+        self.memory.put(key, item)
+        return item
+
+    async def _load(self, key: str, url: str, cached: Optional[CachedImage]) -> CachedImage:
+        if cached is None:
+            cached = await asyncio.to_thread(self.disk.get, key)
+            if cached is not None:
+                self.memory.put(key, cached)
+                if self._is_fresh(cached):
+                    metrics.proxy_requests.inc("disk")
+                    return cached
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        client = self.client
+        import httpx
+
+        started = time.perf_counter()
+        try:
+            response = await client.get(url, headers=headers)
+            metrics.proxy_upstream_seconds.observe(time.perf_counter() - started, str(response.status_code))
+            if response.status_code == 304 and cached is not None:
+                metrics.proxy_requests.inc("revalidated")
+                cached.checked_at = time.time()
+                await asyncio.to_thread(self.disk.touch, key, cached)
+                return cached
+            response.raise_for_status()
+        except Exception as e:
+            if not isinstance(e, httpx.HTTPStatusError):
+                metrics.proxy_upstream_seconds.observe(time.perf_counter() - started, "error")
+            if cached is not None:
+                metrics.proxy_requests.inc("stale")
+                # Serve the stale copy rather than nothing when the speaker is unreachable
+                logger.debug(f"Revalidation failed for {url}, serving cached copy")
+                return cached
+            raise
+
+        metrics.proxy_requests.inc("miss")
+        content = response.content
+        item = CachedImage(
+            content=content,
+            content_type=response.headers.get("content-type", "application/octet-stream"),
+            digest=hashlib.sha256(content).hexdigest(),
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+            checked_at=time.time(),
+        )
+        self.memory.put(key, item)
+        await asyncio.to_thread(self.disk.put, key, item)
+        return item
+
+
+def _load_placeholder(path: Optional[str]) -> Optional[CachedImage]:
+    if not path:
+        return None
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+    except OSError as e:
+        logger.warning(f"Failed to load placeholder image {path}: {e}")
+        return None
+    return CachedImage(
+        content=content,
+        content_type="image/png",
+        digest=hashlib.sha256(content).hexdigest(),
+    )
+
+
+def image_response(
+    image: CachedImage,
+    if_none_match: Optional[str] = None,
+    cache_control: str = CACHE_CONTROL,
+) -> Response:
+    """Build a response for a cached image, answering 304 when the client already has it"""
+    etag = f'"{image.digest}"'
+    headers = {
+        "Cache-Control": cache_control,
+        "ETag": etag,
+        "Access-Control-Allow-Origin": "*",
+    }
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=image.content, media_type=image.content_type, headers=headers)
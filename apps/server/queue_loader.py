@@ -0,0 +1,62 @@
+"""Queues the rest of a container favorite in the background once playback has started"""
+import asyncio
+import logging
+from typing import Dict
+
+from soco import SoCo
+
+import config
+from device_io import async_device
+from sonos import ContainerLoad, ENQUEUE_BATCH_SIZE, browse_container, enqueue_tracks
+
+logger = logging.getLogger(__name__)
+
+
+class QueueLoader:
+    """
+    One background load per device. Children are browsed a page at a time and
+    appended in batches of ENQUEUE_BATCH_SIZE, each batch a separate device call,
+    so commands like volume or pause get their turn in between. Playing something
+    else cancels the load before the queue is replaced.
+    """
+
+    def __init__(self, page_size: int):
+        self.page_size = page_size
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self, device: SoCo, load: ContainerLoad):
+        self.cancel(device)
+        self._tasks[device.ip_address] = asyncio.create_task(self._load(device, load))
+
+    def cancel(self, device: SoCo):
+        task = self._tasks.pop(device.ip_address, None)
+        if task and not task.done():
+            task.cancel()
+
+    async def _load(self, device: SoCo, load: ContainerLoad):
+        dev = async_device(device)
+        start = load.start
+        queued = 0
+        try:
+            while start < load.total:
+                tracks, seen, _ = await dev.run(browse_container, load.ref, start, self.page_size)
+                if not seen:
+                    break
+                start += seen
+                for index in range(0, len(tracks), ENQUEUE_BATCH_SIZE):
+                    batch = tracks[index:index + ENQUEUE_BATCH_SIZE]
+                    # Shielded: a cancelled load still finishes its batch while holding
+                    # the device, so the batch cannot land after the next clear_queue
+                    await asyncio.shield(dev.run(enqueue_tracks, batch))
+                    queued += len(batch)
+            logger.info(f"Queued {queued} more item(s) on {device.ip_address}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Stopped queuing on {device.ip_address} after {queued} item(s): {e}")
+        finally:
+            if self._tasks.get(device.ip_address) is asyncio.current_task():
+                del self._tasks[device.ip_address]
+
+
+queue_loader = QueueLoader(page_size=config.QUEUE_BROWSE_PAGE_SIZE)
@@ -0,0 +1,175 @@
+"""Known speakers persisted to disk, so startup does not wait for discovery"""
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from soco import SoCo
+
+import config
+import device_io
+from device_io import async_device
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DeviceRecord:
+    uid: str
+    ip_address: str
+    player_name: str
+    # uid of the group coordinator, None when unknown
+    group: Optional[str] = None
+    last_seen: float = 0.0
+
+
+def _describe(device: SoCo) -> DeviceRecord:
+    """Read a device's identity. Blocking, run through the device executor."""
+    group = device.group
+    return DeviceRecord(
+        uid=device.uid,
+        ip_address=device.ip_address,
+        player_name=device.player_name,
+        group=group.coordinator.uid if group and group.coordinator else None,
+        last_seen=time.time(),
+    )
+
+
+def describe_visible(device: SoCo) -> Optional[DeviceRecord]:
+    """A device's identity, or None when it is not a room of its own. Blocking."""
+    if not device.is_visible:
+        return None
+    return _describe(device)
+
+
+def _describe_household(device: SoCo) -> List[DeviceRecord]:
+    """Identity of every visible player, from the device's cached zone group state"""
+    return [_describe(zone) for zone in device.visible_zones]
+
+
+class DeviceRegistry:
+    """
+    Remembers IP, UID, name and group of every speaker seen. The server starts
+    from this list and verifies it in the background; topology events keep it current.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._records: Dict[str, DeviceRecord] = {}
+
+    def by_ip(self, ip_address: str) -> Optional[DeviceRecord]:
+        for record in self._records.values():
+            if record.ip_address == ip_address:
+                return record
+        return None
+
+    def devices(self) -> List[SoCo]:
+        """SoCo instances for all known speakers, sorted by name. No network I/O."""
+        records = sorted(self._records.values(), key=lambda record: record.player_name)
+        return [SoCo(record.ip_address) for record in records]
+
+    def update(self, records: List[DeviceRecord]):
+        for record in records:
+            # A speaker that moved to another IP keeps its uid
+            self._records[record.uid] = record
+
+    async def load(self):
+        self._records = await asyncio.to_thread(self._read)
+        if self._records:
+            logger.info(f"Loaded {len(self._records)} known device(s) from registry")
+
+    async def save(self):
+        await asyncio.to_thread(self._write, list(self._records.values()))
+
+    async def refresh(self) -> List[SoCo]:
+        """
+        Discover speakers and check the known ones, returning the reachable devices.
+        Known speakers are probed directly while multicast discovery runs, so this
+        is quick for a known household and still works when multicast does not.
+        """
+        discovery = asyncio.ensure_future(device_io.discover())
+        known = [SoCo(record.ip_address) for record in self._records.values()]
+        records = await self._probe(known)
+
+        try:
+            probed = {device.ip_address for device in known}
+            records += await self._probe(
+                [device for device in await discovery if device.ip_address not in probed]
+            )
+        except Exception as e:
+            logger.warning(f"Multicast discovery failed: {e}")
+
+        self.update(records)
+        await self.save()
+        reachable = {record.ip_address for record in records}
+        return [device for device in self.devices() if device.ip_address in reachable]
+
+    async def _probe(self, devices: List[SoCo]) -> List[DeviceRecord]:
+        results = await asyncio.gather(
+            *(async_device(device).run(_describe) for device in devices),
+            return_exceptions=True,
+        )
+
+        records = []
+        for device, result in zip(devices, results):
+            if isinstance(result, Exception):
+                logger.info(f"Device at {device.ip_address} is not reachable: {result}")
+                continue
+            records.append(result)
+        return records
+
+    async def handle_topology_event(self, device: SoCo) -> Optional[List[SoCo]]:
+        """
+        Refresh records after a ZoneGroupTopology event. SoCo has already applied
+        the event to its zone group state, so no extra requests are made.
+        Returns the household's visible devices when names, addresses or groups changed.
+        """
+        records = await async_device(device).run(_describe_household)
+        changed = any(
+            _identity(self._records.get(record.uid)) != _identity(record) for record in records
+        )
+        self.update(records)
+        if not changed:
+            return None
+
+        await self.save()
+        visible = {record.ip_address for record in records}
+        return [device for device in self.devices() if device.ip_address in visible]
+
+    def _read(self) -> Dict[str, DeviceRecord]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {item["uid"]: DeviceRecord(**item) for item in data.get("devices", [])}
+        except (OSError, ValueError, TypeError, KeyError):
+            return {}
+
+    def _write(self, records: List[DeviceRecord]):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"devices": [asdict(record) for record in records]}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to write device registry: {e}")
+
+
+def _identity(record: Optional[DeviceRecord]):
+    if record is None:
+        return None
+    return record.ip_address, record.player_name, record.group
+
+
+def known_player_name(device: SoCo) -> str:
+    """A device's name, from the registry when known so no request hits the event loop"""
+    record = device_registry.by_ip(device.ip_address)
+    if record:
+        return record.player_name
+    return device.player_name
+
+
+device_registry = DeviceRegistry(config.DEVICE_REGISTRY_PATH)
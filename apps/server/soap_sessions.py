@@ -0,0 +1,127 @@
+"""Keep-alive HTTP sessions for SoCo's SOAP calls, one connection pool per speaker"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+import soco.services
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool
+
+import config
+import metrics
+
+soap_request_seconds = metrics.registry.register(metrics.ThreadSafe(metrics.Histogram(
+    "tunehub_soap_request_seconds", "Duration of SOAP requests to speakers", ["action", "device"]
+)))
+soap_connections = metrics.registry.register(metrics.ThreadSafe(metrics.Counter(
+    "tunehub_soap_connections_total", "TCP connections opened to speakers for SOAP requests", ["device"]
+)))
+
+
+class _CountingConnectionPool(HTTPConnectionPool):
+    """Counts new connections, so reuse shows up in the metrics"""
+
+    def _new_conn(self):
+        soap_connections.inc(self.host)
+        return super()._new_conn()
+
+
+@dataclass
+class _Session:
+    session: requests.Session
+    last_used: float = 0.0
+
+
+def _action(headers: Optional[dict]) -> str:
+    """The action name from a SOAPACTION header, e.g. "AVTransport#Play" """
+    soap_action = (headers or {}).get("SOAPACTION", "").strip('"')
+    service, _, action = soap_action.rpartition("#")
+    if not action:
+        return "unknown"
+    # urn:schemas-upnp-org:service:AVTransport:1 -> AVTransport
+    name = service.split(":")[-2] if service.count(":") >= 2 else service
+    return f"{name}#{action}"
+
+
+class SoapSessionPool:
+    """
+    Sends SoCo's SOAP requests over persistent connections instead of a new TCP
+    connection per call. Each speaker gets its own session with up to pool_size
+    connections. A session idle for longer than idle_timeout is closed before its
+    next use, as the speaker may have dropped the connection in the meantime.
+    Called from the device executor's threads.
+    """
+
+    def __init__(self, pool_size: int, connect_timeout: float, idle_timeout: float):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.idle_timeout = idle_timeout
+        self._sessions: Dict[str, _Session] = {}
+        self._lock = threading.Lock()
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        adapter.poolmanager.pool_classes_by_scheme = {
+            **adapter.poolmanager.pool_classes_by_scheme,
+            "http": _CountingConnectionPool,
+        }
+        session.mount("http://", adapter)
+        return session
+
+    def session(self, host: str) -> requests.Session:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(host)
+            if entry is None:
+                entry = self._sessions[host] = _Session(self._new_session())
+            elif now - entry.last_used > self.idle_timeout:
+                # Closes the idle connections; the session opens new ones as needed
+                entry.session.close()
+            entry.last_used = now
+            return entry.session
+
+    def post(self, url: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        host = urlsplit(url).hostname or ""
+        started = time.perf_counter()
+        try:
+            return self.session(host).post(url, timeout=(self.connect_timeout, timeout), **kwargs)
+        finally:
+            soap_request_seconds.observe(time.perf_counter() - started, _action(kwargs.get("headers")), host)
+
+    def install(self):
+        """
+        Route the control calls of every SoCo instance through this pool. SoCo posts
+        through the module-level requests in soco.services, so the speakers in
+        state.devices use the pool without being wrapped one by one.
+        """
+        soco.services.requests = _RequestsModule(self)
+
+    def close(self):
+        with self._lock:
+            for entry in self._sessions.values():
+                entry.session.close()
+            self._sessions.clear()
+
+
+class _RequestsModule:
+    """Stands in for the requests module inside soco.services; only post is rerouted"""
+
+    def __init__(self, pool: SoapSessionPool):
+        self._pool = pool
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self._pool.post(url, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(requests, name)
+
+
+soap_pool = SoapSessionPool(
+    pool_size=config.SOAP_POOL_SIZE,
+    connect_timeout=config.SOAP_CONNECT_TIMEOUT,
+    idle_timeout=config.SOAP_IDLE_TIMEOUT,
+)
@@ -1,12 +1,17 @@
+from dataclasses import dataclass
 from soco import discover, SoCo
 from typing import TypedDict, Any, Optional, List
 
 SUPPORTED_FAVORITE_TYPES = [
     "audioBroadcast",
-    "object.container.playlistContainer",
+    # Playlists, and generic containers such as "Sonos Presents" or "Trending Now"
+    "object.container",
     "object.item.audioItem.musicTrack",
 ]
 
+# AddMultipleURIsToQueue takes at most 16 URIs per request
+ENQUEUE_BATCH_SIZE = 16
+
 class Favorite(TypedDict):
   title: str
   item_class: str
@@ -54,6 +59,60 @@ def is_playlist_container(item_class: str) -> bool:
 def is_radio(item_class: str) -> bool:
   return bool(item_class and ("audioBroadcast" in item_class or "radio" in item_class.lower()))
 
+@dataclass
+class ContainerLoad:
+  """The part of a container still to be queued after playback started"""
+  ref: Any
+  start: int
+  total: int
+
+def browse_container(zone: SoCo, ref, start: int, count: int):
+  """
+  One page of a container's children. Returns (tracks, children seen, total);
+  children that cannot be queued, like nested containers, are left out.
+  """
+  result = zone.music_library.browse(ml_item=ref, start=start, max_items=count)
+  tracks = [item for item in result if getattr(item, "resources", None) and not is_container(item.item_class)]
+  return tracks, len(result), result.total_matches
+
+def enqueue_tracks(zone: SoCo, tracks: list, container=None):
+  """Append tracks to the queue with one AddMultipleURIsToQueue per batch"""
+  zone.add_multiple_to_queue(tracks, container=container)
+
+def play_container(zone: SoCo, ref, title: str) -> Optional[ContainerLoad]:
+  """
+  Queue the first batch of a container's children and start playing right away.
+  Returns what is left to queue, or None when the container was handled in full.
+  """
+  try:
+    tracks, seen, total = browse_container(zone, ref, 0, ENQUEUE_BATCH_SIZE)
+  except Exception as e:
+    tracks, seen, total = [], 0, 0
+    print(f"  Could not browse container: {e}")
+
+  if not tracks:
+    # Not browsable from here, e.g. a music service container; the speaker may expand it itself
+    print("  No queueable children. Enqueuing container as a whole...")
+    zone.clear_queue()
+    zone.add_to_queue(ref)
+    zone.play_from_queue(index=0)
+    return None
+
+  if is_radio(tracks[0].item_class):
+    # A collection of stations; stations cannot be queued, so play the first one
+    uri, _ = extract_uri_from_item(tracks[0])
+    print("  Station collection detected. Playing first station via play_uri...")
+    zone.play_uri(uri=uri, title=getattr(tracks[0], "title", title))
+    return None
+
+  print(f"  Container detected. Queuing {len(tracks)} of {total} item(s) and starting playback...")
+  zone.clear_queue()
+  enqueue_tracks(zone, tracks)
+  zone.play_from_queue(index=0)
+  if seen >= total:
+    return None
+  return ContainerLoad(ref=ref, start=seen, total=total)
+
 def get_playable_favorites(zone: SoCo) -> List[Favorite]:
   favorites: List[Favorite] = []
   for favorite in zone.music_library.get_sonos_favorites(full_album_art_uri=True):
@@ -89,8 +148,11 @@ def get_playable_favorites(zone: SoCo) -> List[Favorite]:
 
   return favorites
 
-def play_favorite(zone: SoCo, favorite: Favorite | list):
-  """Play a favorite. Accepts the new dict Favorite or the legacy tuple (title, item_class, ref, id)."""
+def play_favorite(zone: SoCo, favorite: Favorite | list) -> Optional[ContainerLoad]:
+  """
+  Play a favorite. Accepts the new dict Favorite or the legacy tuple (title, item_class, ref, id).
+  Returns the rest of a container to queue in the background, if any.
+  """
   # Normalize input
   title = favorite.get("title")
   item_class = favorite.get("item_class") or ""
@@ -115,9 +177,7 @@ def play_favorite(zone: SoCo, favorite: Favorite | list):
           return
 
       elif is_container(item_class):
-        print("NOT SUPPORTED: Container detected, skipping...")
-        # TODO: Handle this case to enqueue child items individually. Unknown how it should behave. This concearns "Trending Now", "Sonos Presents", "Discover Sonos Radio"
-        return
+        return play_container(zone, ref, title)
 
       else:
         print("  Single item detected. Enqueuing...")
@@ -1,28 +1,167 @@
-from typing import List, Optional, Any
+from typing import Awaitable, Callable, List, Optional, Any, Set
 import asyncio
+import hashlib
+import time
+import json
+import logging
+import uuid
+from collections import deque
 from fastapi import WebSocket
 from soco import SoCo
 from connection import ConnectionManager, Event
 from sonos import Favorite, is_playing
+from registry import known_player_name
+from position import PositionAnchor
 from enum import Enum
 
+logger = logging.getLogger(__name__)
+
 class EventTypes(Enum):
     VOLUME = "volume"
     DEVICES = "devices"
+    GROUPS = "groups"
     ACTIVE_DEVICE = "active-device"
     FAVORITES = "favorites"
+    FAVORITES_DELTA = "favorites-delta"
     PLAYBACK_STATE = "playback-state"
+    TRACK_INFO = "play"
+    POSITION = "position"
+    BATCH = "batch"
+    SNAPSHOT = "snapshot"
+
+# Order in which changed keys are sent within one batch.
+# Clients see the device list before the selection, and the selection before its data.
+SYNC_ORDER = [
+    EventTypes.DEVICES.value,
+    EventTypes.GROUPS.value,
+    EventTypes.ACTIVE_DEVICE.value,
+    EventTypes.FAVORITES.value,
+    EventTypes.VOLUME.value,
+    EventTypes.PLAYBACK_STATE.value,
+    EventTypes.TRACK_INFO.value,
+    EventTypes.POSITION.value,
+]
+
+def favorites_hash(items: List[tuple]) -> str:
+    """Content hash of the favorites as sent to clients"""
+    encoded = json.dumps(items, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+def favorites_delta(old: List[tuple], new: List[tuple]) -> Optional[dict]:
+    """
+    Diff two favorites lists by id. Returns None when a full list is the better
+    message, e.g. when ids are missing or most entries changed.
+    The client removes ids, updates or appends upserted items, then applies order if given.
+    """
+    old_ids = [item[1] for item in old]
+    new_ids = [item[1] for item in new]
+    if None in old_ids or None in new_ids:
+        return None
+    if len(set(old_ids)) != len(old_ids) or len(set(new_ids)) != len(new_ids):
+        return None
+
+    old_by_id = {item[1]: item for item in old}
+    new_id_set = set(new_ids)
+    remove = [favorite_id for favorite_id in old_ids if favorite_id not in new_id_set]
+    upsert = [item for item in new if old_by_id.get(item[1]) != item]
+    if len(upsert) * 2 > len(new):
+        return None
+
+    # Only send the order when the client would not end up with it anyway
+    appended = [item[1] for item in new if item[1] not in old_by_id]
+    expected = [favorite_id for favorite_id in old_ids if favorite_id in new_id_set] + appended
+    return {
+        "remove": remove,
+        "upsert": upsert,
+        "order": None if expected == new_ids else new_ids,
+    }
+
+class SyncScheduler:
+    """
+    Collects dirty state keys and flushes them together once per tick.
+    A single flush task runs at a time, so batches always go out in order and
+    a key changed many times within a tick is only sent once, with its latest value.
+    """
+
+    def __init__(self, flush: Callable[[List[str]], Awaitable[None]], interval: float):
+        self.interval = interval
+        self._flush = flush
+        self._dirty: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def mark_dirty(self, key: str):
+        self._dirty.add(key)
+        if self._task and not self._task.done():
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop running; keys are flushed with the next change
+            return
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while self._dirty:
+            await asyncio.sleep(self.interval)
+            keys = [key for key in SYNC_ORDER if key in self._dirty]
+            self._dirty.clear()
+            try:
+                await self._flush(keys)
+            except Exception as e:
+                logger.error(f"Error flushing state sync: {e}")
 
 class StateManager:
-    def __init__(self, cm: ConnectionManager):
+    def __init__(self, cm: ConnectionManager, flush_interval: float = 0.05, history_size: int = 256):
         self._volume: int = 50
         self._devices: List[SoCo] = []
+        self._groups: List[dict] = []
         self._active_device: Optional[SoCo] = None
         self._favorites: List[Favorite] = []
         self._track_info: dict = {"title": None, "artist": None, "album_art": None}
         self._connection_manager: ConnectionManager = cm
         self._playback_state = ""
+        self._position: Optional[PositionAnchor] = None
+        # Favorites as last broadcast; deltas are computed against these
+        self._favorites_sent: List[tuple] = []
+        # None until favorites were fetched once; an empty list is not the same as unknown
+        self._favorites_hash: Optional[str] = None
+        self._favorites_version: int = 0
+        # Every broadcast gets the next sequence number and is kept for resuming clients.
+        # The epoch changes with each server start, invalidating sequence numbers from before.
+        self.epoch: str = uuid.uuid4().hex[:8]
+        self._seq: int = 0
+        self._history: deque = deque(maxlen=history_size)
         self.event_names = EventTypes
+        self._scheduler = SyncScheduler(self._broadcast_keys, flush_interval)
+        self._event_builders = {
+            EventTypes.VOLUME.value: self._volume_event,
+            EventTypes.DEVICES.value: self._devices_event,
+            EventTypes.GROUPS.value: self._groups_event,
+            EventTypes.ACTIVE_DEVICE.value: self._active_device_event,
+            EventTypes.FAVORITES.value: self._favorites_event,
+            EventTypes.PLAYBACK_STATE.value: self._playback_state_event,
+            EventTypes.TRACK_INFO.value: self._track_info_event,
+            EventTypes.POSITION.value: self._position_event,
+        }
+
+    @property
+    def flush_interval(self) -> float:
+        """Seconds state changes are collected before being broadcast"""
+        return self._scheduler.interval
+
+    @flush_interval.setter
+    def flush_interval(self, value: float):
+        self._scheduler.interval = value
+
+    @property
+    def pending_sync(self) -> int:
+        """State keys changed but not yet broadcast"""
+        return self._scheduler.pending
 
     @property
     def volume(self) -> int:
@@ -33,7 +172,7 @@ class StateManager:
     def volume(self, value: int):
         """Set volume and auto-sync"""
         self._volume = value
-        self._trigger_sync(self.event_names.VOLUME.value, self.sync_volume)
+        self._trigger_sync(self.event_names.VOLUME.value)
 
     @property
     def devices(self) -> List[Any]:
@@ -44,7 +183,24 @@ class StateManager:
     def devices(self, value: List[Any]):
         """Set devices and auto-sync"""
         self._devices = value
-        self._trigger_sync(self.event_names.DEVICES.value, self.sync_devices)
+        self._trigger_sync(self.event_names.DEVICES.value)
+
+    def add_device(self, device: SoCo):
+        """Add a newly found device to the list unless it is already there"""
+        if any(known.ip_address == device.ip_address for known in self._devices):
+            return
+        self.devices = sorted([*self._devices, device], key=known_player_name)
+
+    @property
+    def groups(self) -> List[dict]:
+        """Zone groups with their members, volume and playback state"""
+        return self._groups
+
+    @groups.setter
+    def groups(self, value: List[dict]):
+        """Set groups and auto-sync"""
+        self._groups = value
+        self._trigger_sync(self.event_names.GROUPS.value)
 
     @property
     def active_device(self) -> Optional[SoCo]:
@@ -55,7 +211,7 @@ class StateManager:
     def active_device(self, value: Optional[SoCo]):
         """Set active device and auto-sync"""
         self._active_device = value
-        self._trigger_sync(self.event_names.ACTIVE_DEVICE.value, self.sync_active_device)
+        self._trigger_sync(self.event_names.ACTIVE_DEVICE.value)
 
     @property
     def favorites(self) -> List[Favorite]:
@@ -66,7 +222,7 @@ class StateManager:
     def favorites(self, value: List[Favorite]):
         """Set favorites and auto-sync"""
         self._favorites = value
-        self._trigger_sync(self.event_names.FAVORITES.value, self.sync_favorites)
+        self._trigger_sync(self.event_names.FAVORITES.value)
 
     @property
     def track_info(self) -> dict:
@@ -77,84 +233,167 @@ class StateManager:
     def track_info(self, value: dict):
         """Set track info and auto-sync"""
         self._track_info = value
-        self._trigger_sync("play", self.sync_track_info)
-    
+        self._trigger_sync(self.event_names.TRACK_INFO.value)
+
     @property
     def playback_state(self) -> bool:
         return self._playback_state
     @playback_state.setter
     def playback_state(self, value: str):
         self._playback_state = value
-        self._trigger_sync(self.event_names.PLAYBACK_STATE.value, self.sync_playback_state)
-    
-    async def sync_playback_state(self):
+        self._trigger_sync(self.event_names.PLAYBACK_STATE.value)
+
+    @property
+    def position(self) -> Optional[PositionAnchor]:
+        return self._position
+
+    @position.setter
+    def position(self, value: Optional[PositionAnchor]):
+        self._position = value
+        self._trigger_sync(self.event_names.POSITION.value)
+
+    def _trigger_sync(self, key: str):
+        """Mark a key dirty; the scheduler broadcasts it with the next batch."""
+        if not self._connection_manager:
+            return
+
+        self._scheduler.mark_dirty(key)
+
+    async def _broadcast_keys(self, keys: List[str]):
+        """Broadcast the current value of the given keys as one message"""
+        if not self._connection_manager or not keys:
+            return
+
+        events = [event for event in (self._event_builders[key]() for key in keys) if event]
+        if not events:
+            return
+        if len(events) == 1:
+            event = events[0]
+        else:
+            event = Event(type=self.event_names.BATCH.value, data=events)
+
+        self._seq += 1
+        event.seq = self._seq
+        self._history.append(event)
+        await self._connection_manager.broadcast(event)
+
+    def _volume_event(self) -> Event:
+        return Event(type=self.event_names.VOLUME.value, data=self._volume)
+
+    def _devices_event(self) -> Event:
+        device_names = [known_player_name(device) for device in self._devices]
+        return Event(type=self.event_names.DEVICES.value, data=device_names)
+
+    def _groups_event(self) -> Event:
+        return Event(type=self.event_names.GROUPS.value, data=self._groups)
+
+    def _active_device_event(self) -> Event:
+        data = {
+            "device_name": known_player_name(self._active_device) if self._active_device else None
+        }
+        return Event(type=self.event_names.ACTIVE_DEVICE.value, data=data)
+
+    @property
+    def favorites_hash(self) -> Optional[str]:
+        """Hash of the favorites clients were last sent, None before the first fetch"""
+        return self._favorites_hash
+
+    def favorites_full_event(self) -> Event:
+        """The complete favorites list clients were last sent, with its version"""
+        data = {
+            "version": self._favorites_version,
+            "hash": self._favorites_hash,
+            "items": self._favorites_sent,
+        }
+        return Event(type=self.event_names.FAVORITES.value, data=data)
+
+    def _favorites_event(self) -> Optional[Event]:
+        favorites_data = [
+            (fav.get("title"), fav.get("id"), fav.get("description"), fav.get("album_art")) for fav in self._favorites
+        ]
+        digest = favorites_hash(favorites_data)
+        if digest == self._favorites_hash:
+            # Nothing clients do not already have
+            return None
+
+        # The first list after a start goes out in full; clients may hold any version
+        delta = favorites_delta(self._favorites_sent, favorites_data) if self._favorites_hash else None
+        base_version = self._favorites_version
+        self._favorites_sent = favorites_data
+        self._favorites_hash = digest
+        self._favorites_version += 1
+
+        if delta is None:
+            return self.favorites_full_event()
+
+        data = {
+            "base_version": base_version,
+            "version": self._favorites_version,
+            "hash": digest,
+            **delta,
+        }
+        return Event(type=self.event_names.FAVORITES_DELTA.value, data=data)
+
+    def _playback_state_event(self) -> Event:
         data = {
             "isPlaying": self.playback_state == "PLAYING",
         }
-        if self._connection_manager:
-            await self._connection_manager.broadcast(
-                Event(type=self.event_names.PLAYBACK_STATE.value, data=data)
-            )
+        return Event(type=self.event_names.PLAYBACK_STATE.value, data=data)
 
-    def _trigger_sync(self, key: str, sync_func):
-        """Trigger async sync immediately if connection manager exists."""
-        if not self._connection_manager:
+    def _track_info_event(self) -> Event:
+        return Event(type=self.event_names.TRACK_INFO.value, data={"track_info": self._track_info})
+
+    def _position_event(self) -> Event:
+        # Built at flush time, so server_time is as close to the send as possible
+        data = self._position.event_data(time.monotonic()) if self._position else None
+        return Event(type=self.event_names.POSITION.value, data=data)
+
+    def snapshot_event(self) -> Event:
+        """
+        All state in one message for a single client, tagged with the current sequence.
+        Favorites are left out; clients ask for them with their known hash (favorites-sync).
+        """
+        events = {
+            key: self._event_builders[key]().data
+            for key in SYNC_ORDER
+            if key != self.event_names.FAVORITES.value
+        }
+        data = {"epoch": self.epoch, "state": events}
+        return Event(type=self.event_names.SNAPSHOT.value, data=data, seq=self._seq)
+
+    def events_since(self, epoch: Optional[str], seq: Optional[int]) -> Optional[List[Event]]:
+        """
+        The broadcasts a client missed after the given sequence number, or None
+        when they are no longer buffered and the client needs a snapshot.
+        """
+        if epoch != self.epoch or seq is None or seq > self._seq:
+            return None
+        if seq == self._seq:
+            return []
+        if not self._history or self._history[0].seq > seq + 1:
+            return None
+        return [self._replayable(event) for event in self._history if event.seq > seq]
+
+    def _replayable(self, event: Event) -> Event:
+        """
+        A buffered event as it should be sent now. Position anchors carry the server
+        time they were built at, so a replayed one would put the client behind by as
+        long as it was away; they are rebuilt from the current anchor instead.
+        """
+        position = self.event_names.POSITION.value
+        if event.type == position:
+            return Event(type=position, data=self._position_event().data, seq=event.seq)
+        if event.type == self.event_names.BATCH.value and any(inner.type == position for inner in event.data):
+            events = [self._position_event() if inner.type == position else inner for inner in event.data]
+            return Event(type=event.type, data=events, seq=event.seq)
+        return event
+
+    async def sync_client(self, ws: WebSocket, epoch: Optional[str] = None, seq: Optional[int] = None):
+        """Bring one client up to date, replaying missed changes when possible"""
+        missed = self.events_since(epoch, seq)
+        if missed is None:
+            await self._connection_manager.send_event(self.snapshot_event(), ws)
             return
 
-        try:
-            loop = asyncio.get_running_loop()
-            loop.create_task(sync_func())
-        except RuntimeError:
-            # No event loop running; skip auto sync
-            pass
-
-    async def sync_volume(self):
-        """Sync volume state to all clients"""
-        if self._connection_manager:
-            await self._connection_manager.broadcast(
-                Event(type="volume", data=self._volume)
-            )
-
-    async def sync_devices(self):
-        """Sync devices state to all clients"""
-        if self._connection_manager:
-            device_names = [device.player_name for device in self._devices]
-            await self._connection_manager.broadcast(
-                Event(type="devices", data=device_names)
-            )
-
-    async def sync_active_device(self):
-        """Sync active device state to all clients"""
-        if self._connection_manager:
-            data = {
-                "device_name": self._active_device.player_name if self._active_device else None
-            }
-            await self._connection_manager.broadcast(
-                Event(type=self.event_names.ACTIVE_DEVICE.value, data=data)
-            )
-
-    async def sync_favorites(self):
-        """Sync favorites state to all clients"""
-        if self._connection_manager:
-            favorites_data = [
-                (fav.get("title"), fav.get("id"), fav.get("description"), fav.get("album_art")) for fav in self._favorites
-            ]
-            await self._connection_manager.broadcast(
-                Event(type=self.event_names.FAVORITES.value, data=favorites_data)
-            )
-
-    async def sync_track_info(self):
-        """Sync current track info to all clients"""
-        if self._connection_manager:
-            await self._connection_manager.broadcast(
-                Event(type="play", data={"track_info": self._track_info})
-            )
-
-    async def sync_all(self):
-        """Sync all state values to all clients"""
-        await self.sync_volume()
-        await self.sync_devices()
-        await self.sync_active_device()
-        await self.sync_favorites()
-        await self.sync_track_info()
-        await self.sync_playback_state()
\ No newline at end of file
+        for event in missed:
+            await self._connection_manager.send_event(event, ws)
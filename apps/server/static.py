@@ -0,0 +1,172 @@
+"""Serving of the built UI: precompressed variants, ETags, caching and an SPA fallback"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from starlette.responses import FileResponse, Response
+
+logger = logging.getLogger(__name__)
+
+INDEX = "index.html"
+# Only these are served, so the Python sources and data next to the UI stay private
+WEB_EXTENSIONS = {
+    ".html", ".js", ".mjs", ".css", ".map", ".svg", ".png", ".jpg", ".jpeg", ".gif",
+    ".webp", ".avif", ".ico", ".woff", ".woff2", ".ttf", ".webmanifest",
+}
+COMPRESSIBLE_EXTENSIONS = {".html", ".js", ".mjs", ".css", ".map", ".svg", ".webmanifest"}
+IGNORE_DIRS = {"__pycache__", ".venv", "venv", "node_modules", "data", "dist", "benchmarks"}
+# Encodings in order of preference, with the suffix of their pre-generated files
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+# Vite names build output like assets/index-Bx3k9Qz1.js; those never change content
+HASHED_ASSET = re.compile(r"^assets/.+-[A-Za-z0-9_-]{8,}\.[a-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+@dataclass
+class Variant:
+    path: str
+    size: int
+    etag: str
+    # Held in memory when small enough, otherwise streamed from disk
+    content: Optional[bytes] = None
+
+
+@dataclass
+class StaticFile:
+    content_type: str
+    cache_control: str
+    variants: Dict[str, Variant] = field(default_factory=dict)
+
+
+def accepted_encodings(header: Optional[str]) -> set:
+    """Codings from an Accept-Encoding header, ignoring those with q=0"""
+    encodings = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class StaticFiles:
+    """
+    Indexes the UI files once and answers from that index. Pre-generated .br and .gz
+    files are served to clients that accept them; compressible files without a .gz
+    get one made in memory. Hashed assets are cached forever, everything else is
+    revalidated with its ETag, so a reload after the screen saver costs a 304.
+    """
+
+    def __init__(self, root: str, memory_bytes: int, memory_max_file: int):
+        self.root = root
+        self.memory_bytes = memory_bytes
+        self.memory_max_file = memory_max_file
+        self._files: Dict[str, StaticFile] = {}
+        self._memory_used = 0
+
+    def scan(self):
+        """Build the index. Blocking; run through asyncio.to_thread."""
+        files: Dict[str, StaticFile] = {}
+        self._memory_used = 0
+        for directory, dirs, names in os.walk(self.root):
+            dirs[:] = [d for d in dirs if d not in IGNORE_DIRS and not d.startswith(".")]
+            for name in names:
+                if os.path.splitext(name)[1].lower() not in WEB_EXTENSIONS:
+                    continue
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, self.root).replace(os.sep, "/")
+                try:
+                    files[relative] = self._index_file(relative, path)
+                except OSError as e:
+                    logger.warning(f"Not serving {relative}: {e}")
+
+        self._files = files
+        logger.info(f"Serving {len(files)} static file(s), {self._memory_used // 1024} KiB in memory")
+
+    def _index_file(self, relative: str, path: str) -> StaticFile:
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "image/svg+xml"):
+            content_type += "; charset=utf-8"
+        static_file = StaticFile(
+            content_type=content_type,
+            cache_control=IMMUTABLE if HASHED_ASSET.match(relative) else REVALIDATE,
+        )
+
+        identity = self._variant(path, None)
+        static_file.variants["identity"] = identity
+        for encoding, suffix in ENCODINGS:
+            if os.path.isfile(path + suffix):
+                static_file.variants[encoding] = self._variant(path + suffix, encoding)
+
+        compressible = os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS
+        if compressible and "gzip" not in static_file.variants and identity.content is not None:
+            content = gzip.compress(identity.content, compresslevel=9, mtime=0)
+            if len(content) < identity.size:
+                static_file.variants["gzip"] = Variant(
+                    path=path, size=len(content), etag=_etag(content, "gzip"), content=content
+                )
+                self._memory_used += len(content)
+        return static_file
+
+    def _variant(self, path: str, encoding: Optional[str]) -> Variant:
+        size = os.path.getsize(path)
+        if size <= self.memory_max_file and self._memory_used + size <= self.memory_bytes:
+            with open(path, "rb") as f:
+                content = f.read()
+            self._memory_used += size
+            return Variant(path=path, size=size, etag=_etag(content, encoding), content=content)
+
+        stat = os.stat(path)
+        tag = f"{stat.st_mtime_ns:x}-{size:x}".encode("ascii")
+        return Variant(path=path, size=size, etag=_etag(tag, encoding))
+
+    def lookup(self, path: str) -> Optional[StaticFile]:
+        """The file for a request path; the index for SPA routes, None for missing files"""
+        path = path.strip("/") or INDEX
+        static_file = self._files.get(path)
+        if static_file is not None:
+            return static_file
+        if os.path.splitext(path.rsplit("/", 1)[-1])[1]:
+            # Looks like a file, e.g. a stale asset; the index would not help the browser
+            return None
+        return self._files.get(INDEX)
+
+    def response(
+        self, path: str, accept_encoding: Optional[str], if_none_match: Optional[str]
+    ) -> Response:
+        static_file = self.lookup(path)
+        if static_file is None:
+            return Response(status_code=404)
+
+        accepted = accepted_encodings(accept_encoding)
+        encoding = next(
+            (name for name, _ in ENCODINGS if name in accepted and name in static_file.variants),
+            "identity",
+        )
+        variant = static_file.variants[encoding]
+
+        headers = {
+            "Cache-Control": static_file.cache_control,
+            "ETag": variant.etag,
+            "Vary": "Accept-Encoding",
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        if if_none_match and variant.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        if variant.content is not None:
+            return Response(content=variant.content, media_type=static_file.content_type, headers=headers)
+        return FileResponse(variant.path, media_type=static_file.content_type, headers=headers)
+
+
+def _etag(content: bytes, encoding: Optional[str]) -> str:
+    digest = hashlib.sha1(content).hexdigest()[:16]
+    return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
@@ -0,0 +1,236 @@
+"""Supervised UPnP event subscriptions, renewed and re-established in the background"""
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+from soco import SoCo
+from soco import events_asyncio
+
+import config
+import metrics
+from registry import known_player_name
+
+logger = logging.getLogger(__name__)
+
+# Subscription key -> SoCo service attribute
+SERVICES = {
+    "rendering": "renderingControl",
+    "transport": "avTransport",
+    "content_directory": "contentDirectory",
+    # Also keeps SoCo's zone group state current, so names and groups need no polling
+    "topology": "zoneGroupTopology",
+}
+
+STATUS_SUBSCRIBING = "subscribing"
+STATUS_ACTIVE = "active"
+STATUS_RETRYING = "retrying"
+
+# Subscription key -> event callback, built once per device
+CallbackFactory = Callable[[SoCo], Dict[str, Callable]]
+
+
+class SubscriptionLost(Exception):
+    """A subscription expired, failed to renew, or the speaker forgot it"""
+
+
+@dataclass
+class DeviceSubscriptions:
+    device: SoCo
+    subs: Dict[str, events_asyncio.Subscription] = field(default_factory=dict)
+    status: str = STATUS_SUBSCRIBING
+    failures: int = 0
+    last_error: Optional[str] = None
+    # time.monotonic() of the last event, and of the last sign of life (event or renewal)
+    last_event: Optional[float] = None
+    last_seen: float = 0.0
+    retry_at: Optional[float] = None
+    # time.monotonic() when the current subscriptions were requested; None while down.
+    # Anything an event reported after it is still current.
+    active_since: Optional[float] = None
+    task: Optional[asyncio.Task] = None
+    lost: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class SubscriptionSupervisor:
+    """
+    Owns every event subscription. Each watched device gets a task that subscribes
+    with auto-renewal, checks renewal deadlines, renews early when the speaker has
+    been quiet for a while (events only arrive on change, so silence alone proves
+    nothing), and resubscribes with jittered exponential backoff when anything fails.
+    Callers only say which devices to watch and never wait for the network.
+    """
+
+    def __init__(
+        self,
+        requested_timeout: int,
+        heartbeat_interval: float,
+        backoff_base: float,
+        backoff_max: float,
+        callbacks: Optional[CallbackFactory] = None,
+    ):
+        self.requested_timeout = requested_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.callbacks = callbacks
+        self._devices: Dict[str, DeviceSubscriptions] = {}
+
+    def watch(self, device: SoCo):
+        """Keep a device subscribed from now on; returns immediately"""
+        entry = self._devices.get(device.ip_address)
+        if entry and entry.task and not entry.task.done():
+            return
+
+        entry = self._devices[device.ip_address] = DeviceSubscriptions(device=device)
+        entry.task = asyncio.create_task(self._supervise(entry))
+
+    async def unwatch(self, device: SoCo):
+        entry = self._devices.pop(device.ip_address, None)
+        if entry:
+            logger.info(f"Unsubscribing from {known_player_name(device)}")
+            await self._stop(entry)
+
+    async def unwatch_all(self, stop_listener: bool = True):
+        entries = list(self._devices.values())
+        self._devices.clear()
+        await asyncio.gather(*(self._stop(entry) for entry in entries), return_exceptions=True)
+
+        if not stop_listener:
+            return
+        try:
+            await asyncio.wait_for(events_asyncio.event_listener.async_stop(), timeout=3.0)
+            logger.info("Event listener stopped")
+        except Exception as e:
+            logger.debug(f"Error stopping event listener: {e}")
+
+    def active_since(self, device: SoCo) -> Optional[float]:
+        """Since when events keep the device's state current, None if they do not"""
+        entry = self._devices.get(device.ip_address)
+        if entry is None or entry.status != STATUS_ACTIVE or entry.lost.is_set():
+            return None
+        return entry.active_since
+
+    def health(self) -> Dict[str, dict]:
+        """Subscription state per device, for diagnostics"""
+        now = time.monotonic()
+        report = {}
+        for entry in self._devices.values():
+            time_left = [sub.time_left for sub in entry.subs.values()]
+            report[known_player_name(entry.device)] = {
+                "ip_address": entry.device.ip_address,
+                "status": entry.status,
+                "services": sorted(entry.subs),
+                "expires_in": round(min(time_left), 1) if time_left else None,
+                "last_event_age": round(now - entry.last_event, 1) if entry.last_event else None,
+                "failures": entry.failures,
+                "last_error": entry.last_error,
+                "retry_in": round(max(0.0, entry.retry_at - now), 1) if entry.retry_at else None,
+            }
+        return report
+
+    async def _supervise(self, entry: DeviceSubscriptions):
+        device_name = known_player_name(entry.device)
+        while True:
+            try:
+                await self._subscribe(entry)
+                logger.info(f"Subscribed to {device_name}")
+                await self._monitor(entry)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                entry.active_since = None
+                entry.failures += 1
+                entry.last_error = str(e) or type(e).__name__
+                await self._cancel_subscriptions(entry)
+
+                delay = self._backoff(entry.failures)
+                entry.status = STATUS_RETRYING
+                entry.retry_at = time.monotonic() + delay
+                logger.warning(
+                    f"Subscriptions for {device_name} lost ({entry.last_error}), retrying in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+
+    async def _subscribe(self, entry: DeviceSubscriptions):
+        entry.status = STATUS_SUBSCRIBING
+        entry.retry_at = None
+        entry.lost.clear()
+        requested_at = time.monotonic()
+        callbacks = self.callbacks(entry.device) if self.callbacks else {}
+
+        for key, service_name in SERVICES.items():
+            service = getattr(entry.device, service_name)
+            sub = await service.subscribe(requested_timeout=self.requested_timeout, auto_renew=True)
+            # Called on the event loop when a background renewal fails
+            sub.auto_renew_fail = lambda exc: entry.lost.set()
+            sub.callback = self._track(entry, key, callbacks.get(key))
+            entry.subs[key] = sub
+
+        entry.status = STATUS_ACTIVE
+        # Initial events may have arrived while the other services were subscribing
+        entry.active_since = requested_at
+        entry.failures = 0
+        entry.last_error = None
+        entry.last_seen = time.monotonic()
+
+    def _track(self, entry: DeviceSubscriptions, key: str, callback: Optional[Callable]) -> Callable:
+        def on_event(event):
+            entry.last_event = entry.last_seen = time.monotonic()
+            metrics.gena_events.inc(key)
+            if callback:
+                callback(event)
+
+        return on_event
+
+    async def _monitor(self, entry: DeviceSubscriptions):
+        check_interval = min(self.heartbeat_interval, 10.0)
+        while True:
+            try:
+                await asyncio.wait_for(entry.lost.wait(), timeout=check_interval)
+                raise SubscriptionLost("renewal failed")
+            except asyncio.TimeoutError:
+                pass
+
+            for key, sub in entry.subs.items():
+                if not sub.is_subscribed or sub.time_left <= 0:
+                    raise SubscriptionLost(f"{key} subscription expired")
+
+            if time.monotonic() - entry.last_seen >= self.heartbeat_interval:
+                # A speaker that rebooted rejects the renewal of a SID it no longer knows
+                await asyncio.gather(*(sub.renew() for sub in entry.subs.values()))
+                entry.last_seen = time.monotonic()
+
+    async def _stop(self, entry: DeviceSubscriptions):
+        if entry.task:
+            entry.task.cancel()
+            try:
+                await entry.task
+            except (asyncio.CancelledError, Exception):
+                pass
+        await self._cancel_subscriptions(entry)
+
+    async def _cancel_subscriptions(self, entry: DeviceSubscriptions):
+        subs = list(entry.subs.values())
+        entry.subs.clear()
+        for sub in subs:
+            try:
+                await asyncio.wait_for(sub.unsubscribe(), timeout=2.0)
+            except Exception:
+                # Already gone on the speaker's side; SoCo has cancelled it locally
+                pass
+
+    def _backoff(self, failures: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1))
+        # Jitter keeps speakers that dropped together from being retried in lockstep
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+subscription_supervisor = SubscriptionSupervisor(
+    requested_timeout=config.SUBSCRIPTION_TIMEOUT,
+    heartbeat_interval=config.SUBSCRIPTION_HEARTBEAT_INTERVAL,
+    backoff_base=config.SUBSCRIPTION_BACKOFF_BASE,
+    backoff_max=config.SUBSCRIPTION_BACKOFF_MAX,
+)
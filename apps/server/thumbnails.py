@@ -0,0 +1,55 @@
+"""Downscaling of album art to the size the screen actually shows"""
+import importlib.util
+import io
+import logging
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+DEFAULT_FORMAT = "jpeg"
+MAX_DIMENSION = 1024
+QUALITY = 80
+
+# Pillow is optional, the proxy then serves the original image. It is only
+# looked up here and imported on the first resize, so it does not slow down startup.
+_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+
+def is_available() -> bool:
+    return _AVAILABLE
+
+
+def normalize_size(width: Optional[int], height: Optional[int]) -> Optional[Tuple[int, int]]:
+    """Clamp requested dimensions; a missing side is bounded by the other one"""
+    if not width and not height:
+        return None
+    width = min(max(width or height, 1), MAX_DIMENSION)
+    height = min(max(height or width, 1), MAX_DIMENSION)
+    return width, height
+
+
+def resize_image(content: bytes, size: Tuple[int, int], fmt: str) -> Tuple[bytes, str]:
+    """
+    Fit the image into the given box, keeping its aspect ratio and never upscaling.
+    CPU bound, call through asyncio.to_thread.
+    """
+    from PIL import Image
+
+    pil_format, content_type = FORMATS[fmt]
+
+    with Image.open(io.BytesIO(content)) as image:
+        # Let the decoder skip most of the work for large JPEGs
+        image.draft("RGB", size)
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+
+        if image.mode not in ("RGB", "RGBA") or (pil_format == "JPEG" and image.mode == "RGBA"):
+            image = image.convert("RGB")
+
+        out = io.BytesIO()
+        image.save(out, pil_format, quality=QUALITY)
+
+    return out.getvalue(), content_type
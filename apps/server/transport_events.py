@@ -0,0 +1,96 @@
+"""Normalizes AVTransport events into track info, reusing results for repeated metadata"""
+import logging
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from soco import SoCo
+
+logger = logging.getLogger(__name__)
+
+# Normalized tracks remembered across all devices
+MEMO_SIZE = 256
+
+
+def _metadata_key(device: SoCo, variables: dict) -> tuple:
+    """Everything the normalized track info depends on"""
+    metadata = variables.get("current_track_meta_data")
+    enqueued_metadata = variables.get("enqueued_transport_uri_meta_data")
+    return (
+        device.ip_address,
+        variables.get("current_track_uri"),
+        getattr(metadata, "title", None),
+        getattr(metadata, "creator", None),
+        getattr(metadata, "stream_content", None),
+        getattr(metadata, "album_art_uri", None),
+        getattr(enqueued_metadata, "title", None),
+        # Metadata without title and creator falls back to the enqueued item
+        hasattr(metadata, "title") and hasattr(metadata, "creator"),
+    )
+
+
+def normalize_track_info(device: SoCo, variables: dict) -> dict:
+    """Title, artist and full album art URL shown for a transport event"""
+    title = None
+    artist = None
+    album_art = None
+
+    metadata = variables.get("current_track_meta_data")
+    enqueued_metadata = variables.get("enqueued_transport_uri_meta_data")
+
+    if metadata and hasattr(metadata, "title") and hasattr(metadata, "creator"):
+        title = metadata.title
+        artist = metadata.creator
+
+        if hasattr(metadata, "album_art_uri") and metadata.album_art_uri:
+            try:
+                album_art = device.music_library.build_album_art_full_uri(metadata.album_art_uri)
+            except Exception as e:
+                logger.debug(f"Failed to build album art URI: {e}")
+
+    elif enqueued_metadata and hasattr(enqueued_metadata, "title") and enqueued_metadata.title:
+        if metadata and hasattr(metadata, "stream_content"):
+            title = metadata.stream_content
+        else:
+            title = enqueued_metadata.title
+
+        artist = enqueued_metadata.title
+
+        if metadata and hasattr(metadata, "album_art_uri") and metadata.album_art_uri:
+            try:
+                album_art = device.music_library.build_album_art_full_uri(metadata.album_art_uri)
+            except Exception as e:
+                logger.debug(f"Failed to build album art URI for radio: {e}")
+
+    return {
+        "title": title,
+        "artist": artist,
+        "album_art": album_art,
+    }
+
+
+class TransportEventProcessor:
+    """
+    Turns transport events into (track_info, transport_state). Track info is memoized
+    by track URI and the metadata fields it is built from, so repeated events, such as
+    the periodic metadata ticks of radio streams, yield the same dict without
+    rebuilding album art URLs.
+    """
+
+    def __init__(self, memo_size: int = MEMO_SIZE):
+        self.memo_size = memo_size
+        self._memo: OrderedDict = OrderedDict()
+
+    def process(self, device: SoCo, variables: dict) -> Tuple[dict, Optional[str]]:
+        key = _metadata_key(device, variables)
+        track_info = self._memo.get(key)
+        if track_info is None:
+            track_info = self._memo[key] = normalize_track_info(device, variables)
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        else:
+            self._memo.move_to_end(key)
+
+        return track_info, variables.get("transport_state")
+
+
+transport_processor = TransportEventProcessor()
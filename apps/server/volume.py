@@ -0,0 +1,80 @@
+"""Latest-wins volume control, so slider drags do not queue up SOAP calls"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set
+
+from soco import SoCo
+
+from device_io import async_device
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for the rendering event confirming a volume we set
+CONFIRM_TIMEOUT = 2.0
+
+
+class VolumePipeline:
+    """
+    Keeps only the newest volume target for a device and sends it as one absolute
+    SetVolume, with at most one request in flight. Targets submitted while a request
+    is running replace each other, so only the last one is sent afterwards.
+    """
+
+    def __init__(self, device: SoCo):
+        self.device = device
+        self._target: Optional[int] = None
+        self._expected: Optional[int] = None
+        self._expected_until = 0.0
+        # Volumes sent since the last confirmation, whose echoes may still arrive
+        self._sent: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def submit(self, volume: int):
+        self._target = volume
+        self._expected = volume
+        self._expected_until = float("inf")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        device = async_device(self.device)
+        while self._target is not None:
+            target = self._target
+            self._target = None
+            self._sent.add(target)
+            try:
+                await device.set("volume", target)
+            except Exception as e:
+                logger.warning(f"Failed to set volume {target} on {self.device.ip_address}: {e}")
+
+        # Nothing left to send; give the confirming event a little time to arrive
+        self._expected_until = time.monotonic() + CONFIRM_TIMEOUT
+
+    def accept_event(self, volume: int) -> bool:
+        """
+        Whether a rendering event should update the shared state.
+        While our own change is pending, echoes of superseded targets are ignored
+        so the slider does not jump back; other volumes were set elsewhere, e.g. on
+        the speaker, and pass through. A change elsewhere to a volume we also sent
+        looks like an echo and is only picked up by a later event.
+        """
+        if self._expected is None:
+            return True
+
+        if volume == self._expected or time.monotonic() > self._expected_until:
+            self._expected = None
+            self._sent.clear()
+            return True
+
+        return volume not in self._sent
+
+
+_pipelines: Dict[str, VolumePipeline] = {}
+
+
+def volume_pipeline(device: SoCo) -> VolumePipeline:
+    pipeline = _pipelines.get(device.ip_address)
+    if pipeline is None or pipeline.device is not device:
+        pipeline = _pipelines[device.ip_address] = VolumePipeline(device)
+    return pipeline
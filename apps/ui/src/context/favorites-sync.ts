@@ -0,0 +1,63 @@
+import type { PlayerContextValue } from "./player-context";
+
+type FavoriteItem = PlayerContextValue["favorites"][number];
+
+export interface FavoritesSnapshot {
+  version: number;
+  hash: string | null;
+  items: FavoriteItem[];
+}
+
+export interface FavoritesDelta {
+  base_version: number;
+  version: number;
+  hash: string;
+  remove: string[];
+  upsert: FavoriteItem[];
+  order: string[] | null;
+}
+
+const STORAGE_KEY = "tunehub.favorites";
+
+export const EMPTY_FAVORITES: FavoritesSnapshot = {
+  version: 0,
+  hash: null,
+  items: [],
+};
+
+/** Favorites from the last session, so a reload does not need them resent */
+export function loadFavorites(): FavoritesSnapshot {
+  try {
+    const stored = localStorage.getItem(STORAGE_KEY);
+    return stored ? (JSON.parse(stored) as FavoritesSnapshot) : EMPTY_FAVORITES;
+  } catch {
+    return EMPTY_FAVORITES;
+  }
+}
+
+export function storeFavorites(snapshot: FavoritesSnapshot) {
+  try {
+    localStorage.setItem(STORAGE_KEY, JSON.stringify(snapshot));
+  } catch {
+    // Storage full or unavailable; favorites are simply resent next time
+  }
+}
+
+/** Apply a server diff: remove ids, update or append upserted items, then reorder */
+export function applyFavoritesDelta(
+  items: FavoriteItem[],
+  delta: FavoritesDelta
+): FavoriteItem[] {
+  const byId = new Map(items.map((item) => [item[1], item]));
+  delta.remove.forEach((id) => byId.delete(id));
+
+  const ids = items.map((item) => item[1]).filter((id) => byId.has(id));
+  delta.upsert.forEach((item) => {
+    if (!byId.has(item[1])) ids.push(item[1]);
+    byId.set(item[1], item);
+  });
+
+  return (delta.order ?? ids)
+    .map((id) => byId.get(id))
+    .filter((item): item is FavoriteItem => item !== undefined);
+}
@@ -6,12 +6,31 @@ export type TrackInfo = {
   album_art: string | null;
 };
 
+export type ZoneGroup = {
+  coordinator: string;
+  // Room names, coordinator first
+  members: string[];
+  volume: number | null;
+  playback_state: string | null;
+};
+
+// Playback position as of `receivedAt` (performance.now()); advances at `rate` while playing
+export type PlaybackPosition = {
+  position: number;
+  duration: number | null;
+  playing: boolean;
+  rate: number;
+  receivedAt: number;
+};
+
 export type PlayerContextValue = {
   volume: number;
   devices: string[];
+  groups: ZoneGroup[];
   activeDevice?: { device_name: string };
   favorites: Array<[string, string, string, string]>;
   playbackState: { isPlaying: boolean };
+  playbackPosition: PlaybackPosition | null;
   lastEventTime: Date;
   currentTrack: {
     favorite_id?: string;
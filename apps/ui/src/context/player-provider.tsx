@@ -1,7 +1,14 @@
-import { useState, useCallback, useEffect } from "react";
+import { useState, useCallback, useEffect, useRef } from "react";
 import { PlayerContext, type PlayerContextValue } from "./player-context";
 import useWebSocket from "react-use-websocket";
 import { useDebouncedCallback } from "../hooks/use-debounce";
+import {
+  applyFavoritesDelta,
+  loadFavorites,
+  storeFavorites,
+  type FavoritesDelta,
+  type FavoritesSnapshot,
+} from "./favorites-sync";
 
 const SOCKET_URL =
   import.meta.env.VITE_WEBSOCKET_URL || "ws://localhost:8000/ws";
@@ -9,11 +16,29 @@ const SOCKET_URL =
 export interface SocketEvent<T = unknown> {
   type: string;
   data: T;
+  // Position in the server's state stream; absent on replies to this client only
+  seq?: number;
+}
+
+interface PositionAnchor {
+  position: number;
+  duration: number | null;
+  playing: boolean;
+  rate: number;
+  // Server monotonic clock: when position was measured, and when the message was built
+  anchored_at: number;
+  server_time: number;
+}
+
+interface StateSnapshot {
+  epoch: string;
+  state: Record<string, unknown>;
 }
 
 export function EventProvider({ children }: { children: React.ReactNode }) {
   const [volume, setVolume] = useState<number>(50);
   const [devices, setDevices] = useState<string[]>([]);
+  const [groups, setGroups] = useState<PlayerContextValue["groups"]>([]);
   const [activeDevice, setActiveDevice] =
     useState<PlayerContextValue["activeDevice"]>();
   const [currentTrack, setCurrentTrack] = useState<
@@ -22,62 +47,171 @@ export function EventProvider({ children }: { children: React.ReactNode }) {
     favorite_id: undefined,
     track_info: undefined,
   });
+  // Versioned copy of the favorites; the server only sends diffs against it
+  const favoritesRef = useRef<FavoritesSnapshot>(loadFavorites());
   const [favorites, setFavorites] = useState<PlayerContextValue["favorites"]>(
-    []
+    favoritesRef.current.items
   );
 
   const [playbackState, setPlaybackState] = useState<
     PlayerContextValue["playbackState"]
   >({ isPlaying: false });
 
+  const [playbackPosition, setPlaybackPosition] =
+    useState<PlayerContextValue["playbackPosition"]>(null);
+
   const [lastEventTime, setLastEventTime] = useState<Date>(new Date());
 
-  const { sendJsonMessage, lastJsonMessage, readyState } = useWebSocket<SocketEvent>(
-    SOCKET_URL,
+  // Where we are in the server's state stream, so a reconnect only replays what we missed
+  const sessionRef = useRef<{ epoch?: string; seq?: number }>({});
+
+  const getSocketUrl = useCallback(() => {
+    const { epoch, seq } = sessionRef.current;
+    if (!epoch || seq === undefined) return SOCKET_URL;
+
+    const url = new URL(SOCKET_URL);
+    url.searchParams.set("epoch", epoch);
+    url.searchParams.set("since", String(seq));
+    return url.toString();
+  }, []);
+
+  const resumePendingRef = useRef(false);
+  const handleMessageRef = useRef<(event: SocketEvent) => void>(() => {});
+
+  const { sendJsonMessage, readyState } = useWebSocket<SocketEvent>(
+    getSocketUrl,
     {
       share: true,
       shouldReconnect: () => true,
+      // Every message is handled; lastJsonMessage may skip some when they arrive together
+      onMessage: (message) => handleMessageRef.current(JSON.parse(message.data)),
     }
   );
 
-  useEffect(() => {
-    if (!lastJsonMessage) return;
+  const updateFavorites = useCallback((snapshot: FavoritesSnapshot) => {
+    favoritesRef.current = snapshot;
+    storeFavorites(snapshot);
+    setFavorites(snapshot.items);
+  }, []);
 
-    if (!Object.hasOwn(lastJsonMessage, "type")) return;
-    if (!Object.hasOwn(lastJsonMessage, "data")) return;
+  // Tell the server which favorites we hold; it only answers if they are outdated
+  const syncFavorites = useCallback(
+    (hash: string | null) => {
+      sendJsonMessage({ type: "favorites-sync", data: { hash } });
+    },
+    [sendJsonMessage]
+  );
+
+  useEffect(() => {
+    if (readyState === WebSocket.OPEN) {
+      syncFavorites(favoritesRef.current.hash);
+    }
+  }, [readyState, syncFavorites]);
 
-    switch (lastJsonMessage.type) {
+  const handleEvent = useCallback((event: SocketEvent) => {
+    switch (event.type) {
       case "volume":
-        setVolume(lastJsonMessage.data as number);
+        setVolume(event.data as number);
         break;
       case "devices":
-        setDevices(lastJsonMessage.data as string[]);
+        setDevices(event.data as string[]);
+        break;
+      case "groups":
+        setGroups(event.data as PlayerContextValue["groups"]);
         break;
       case "active-device":
-        setActiveDevice(
-          lastJsonMessage.data as PlayerContextValue["activeDevice"]
-        );
+        setActiveDevice(event.data as PlayerContextValue["activeDevice"]);
         break;
       case "play":
-        setCurrentTrack(
-          lastJsonMessage.data as PlayerContextValue["currentTrack"]
-        );
+        setCurrentTrack(event.data as PlayerContextValue["currentTrack"]);
         break;
       case "playback-state":
-        setPlaybackState(
-          lastJsonMessage.data as PlayerContextValue["playbackState"]
+        setPlaybackState(event.data as PlayerContextValue["playbackState"]);
+        break;
+      case "position": {
+        const anchor = event.data as PositionAnchor | null;
+        // Carry the anchor over to our own clock; only deltas of the server clock are meaningful
+        setPlaybackPosition(
+          anchor && {
+            position:
+              anchor.position +
+              (anchor.server_time - anchor.anchored_at) * anchor.rate,
+            duration: anchor.duration,
+            playing: anchor.playing,
+            rate: anchor.rate,
+            receivedAt: performance.now(),
+          }
         );
         break;
+      }
       case "favorites":
-        setFavorites(lastJsonMessage.data as PlayerContextValue["favorites"]);
+        updateFavorites(event.data as FavoritesSnapshot);
+        break;
+      case "favorites-delta": {
+        const delta = event.data as FavoritesDelta;
+        if (delta.base_version !== favoritesRef.current.version) {
+          // Missed a version; ask for the full list
+          syncFavorites(null);
+          break;
+        }
+        updateFavorites({
+          version: delta.version,
+          hash: delta.hash,
+          items: applyFavoritesDelta(favoritesRef.current.items, delta),
+        });
         break;
+      }
       default:
-        console.log("Unknown event: ", lastJsonMessage);
+        console.log("Unknown event: ", event);
         break;
     }
+  }, [updateFavorites, syncFavorites]);
+
+  const handleMessage = useCallback((message: SocketEvent) => {
+    if (!Object.hasOwn(message, "type")) return;
+    if (!Object.hasOwn(message, "data")) return;
+
+    if (message.type === "snapshot") {
+      const snapshot = message.data as StateSnapshot;
+      sessionRef.current = { epoch: snapshot.epoch, seq: message.seq };
+      resumePendingRef.current = false;
+      Object.entries(snapshot.state).forEach(([type, data]) =>
+        handleEvent({ type, data })
+      );
+      setLastEventTime(new Date());
+      return;
+    }
+
+    if (message.seq !== undefined) {
+      const { epoch, seq } = sessionRef.current;
+      if (seq !== undefined) {
+        // Already applied, e.g. replayed after a resume
+        if (message.seq <= seq) return;
+
+        if (message.seq !== seq + 1) {
+          // A message was lost; have the server replay from the last one we have
+          if (!resumePendingRef.current) {
+            resumePendingRef.current = true;
+            sendJsonMessage({ type: "resume", data: { epoch, since: seq } });
+          }
+          return;
+        }
+      }
+      resumePendingRef.current = false;
+      sessionRef.current.seq = message.seq;
+    }
+
+    // Several state changes flushed together arrive as one batch, in server order
+    const events =
+      message.type === "batch" ? (message.data as SocketEvent[]) : [message];
+    events.forEach(handleEvent);
 
     setLastEventTime(new Date());
-  }, [lastJsonMessage]);
+  }, [handleEvent, sendJsonMessage]);
+
+  useEffect(() => {
+    handleMessageRef.current = handleMessage;
+  }, [handleMessage]);
 
   const play = useCallback(
     ({ favorite_id }: { favorite_id: string }) => {
@@ -147,10 +281,12 @@ export function EventProvider({ children }: { children: React.ReactNode }) {
         lastEventTime,
         volume,
         devices,
+        groups,
         activeDevice,
         favorites,
         currentTrack,
         playbackState,
+        playbackPosition,
         changeActiveDevice,
         changeVolume,
         togglePlaybackState,
@@ -0,0 +1,38 @@
+import { useEffect, useState } from "react";
+import type { PlaybackPosition } from "../context/player-context";
+
+function currentPosition(anchor: PlaybackPosition): number {
+  const elapsed = anchor.playing
+    ? ((performance.now() - anchor.receivedAt) / 1000) * anchor.rate
+    : 0;
+  const position = anchor.position + elapsed;
+  return anchor.duration ? Math.min(position, anchor.duration) : position;
+}
+
+// Seconds into the track, advanced locally between the server's anchors
+export function usePlaybackPosition(
+  anchor: PlaybackPosition | null,
+  interval = 250
+): number | null {
+  const [position, setPosition] = useState<number | null>(
+    anchor ? currentPosition(anchor) : null
+  );
+
+  useEffect(() => {
+    if (!anchor) {
+      setPosition(null);
+      return;
+    }
+
+    setPosition(currentPosition(anchor));
+    if (!anchor.playing) return;
+
+    const timer = setInterval(
+      () => setPosition(currentPosition(anchor)),
+      interval
+    );
+    return () => clearInterval(timer);
+  }, [anchor, interval]);
+
+  return position;
+}
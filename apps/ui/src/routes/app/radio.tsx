@@ -4,8 +4,11 @@ import ColorThief from "colorthief";
 import { LucidePause, LucidePlay } from "lucide-react";
 import { usePlayer } from "../../hooks/use-player";
 import NoDeviceSelected from "../../context/no-deivce-selected";
+import { usePlaybackPosition } from "../../hooks/use-playback-position";
 
 const API_BASE = import.meta.env.VITE_API_BASE_URL || "http://localhost:8000";
+// Cover is shown at h-72 (288px); let the server downscale before the browser decodes it
+const COVER_ART_SIZE = 288;
 
 export const Route = createFileRoute("/app/radio")({
   component: RouteComponent,
@@ -23,10 +26,13 @@ function RouteComponent() {
     playbackState,
     togglePlaybackState,
     activeDevice,
+    playbackPosition,
   } = usePlayer();
+  const position = usePlaybackPosition(playbackPosition);
+  const duration = playbackPosition?.duration;
 
   const imgRef = useRef<HTMLImageElement>(null);
-  const coverArt = `${API_BASE}/proxy?url=${encodeURIComponent(currentTrack.track_info?.album_art || "")}`;
+  const coverArt = `${API_BASE}/proxy?url=${encodeURIComponent(currentTrack.track_info?.album_art || "")}&w=${COVER_ART_SIZE}&h=${COVER_ART_SIZE}&format=webp`;
 
   const extractColor = () => {
     if (!imgRef.current) return;
@@ -100,9 +106,18 @@ function RouteComponent() {
         </div>
       </div>
       <div className="grid grid-rows-1 grid-cols-3 gap-1 h-21">
-        <div className="col-span-2 p-2">
+        <div className="col-span-2 p-2 relative">
           <h1 className="text-3xl text-neutral-100 truncate">{title}</h1>
           <h2 className="text-2xl text-neutral-500">{artist}</h2>
+          {/* Streams have no duration; only tracks get a progress bar */}
+          {duration && position !== null ? (
+            <div className="absolute inset-x-2 bottom-0 h-1 bg-neutral-800 rounded-full overflow-hidden">
+              <div
+                className="h-full bg-neutral-100"
+                style={{ width: `${(position / duration) * 100}%` }}
+              />
+            </div>
+          ) : null}
         </div>
         <div className="col-span-1 flex items-center justify-start">
           <button
@@ -1,5 +1,6 @@
 import fs from "fs";
 import path from "path";
+import zlib from "zlib";
 import { fileURLToPath } from "url";
 
 const __filename = fileURLToPath(import.meta.url);
@@ -10,6 +11,36 @@ const rootDist = path.join(__dirname, "..", "dist");
 const uiDist = path.join(__dirname, "..", "apps", "ui", "dist");
 const pyDist = path.join(__dirname, "..", "apps", "server", "dist");
 
+// UI files worth precompressing; the server picks .br or .gz by Accept-Encoding
+const COMPRESSIBLE = new Set([".html", ".js", ".mjs", ".css", ".svg", ".map", ".webmanifest"]);
+const MIN_COMPRESS_BYTES = 1024;
+
+function compressFolder(dir) {
+  for (const item of fs.readdirSync(dir)) {
+    const filePath = path.join(dir, item);
+
+    if (fs.lstatSync(filePath).isDirectory()) {
+      compressFolder(filePath);
+      continue;
+    }
+    if (!COMPRESSIBLE.has(path.extname(item))) continue;
+
+    const content = fs.readFileSync(filePath);
+    if (content.length < MIN_COMPRESS_BYTES) continue;
+
+    fs.writeFileSync(filePath + ".gz", zlib.gzipSync(content, { level: 9 }));
+    fs.writeFileSync(
+      filePath + ".br",
+      zlib.brotliCompressSync(content, {
+        params: {
+          [zlib.constants.BROTLI_PARAM_QUALITY]: 11,
+          [zlib.constants.BROTLI_PARAM_SIZE_HINT]: content.length,
+        },
+      })
+    );
+  }
+}
+
 function copyFolder(src, dest) {
   if (!fs.existsSync(src)) return;
 
@@ -34,6 +65,7 @@ if (fs.existsSync(rootDist)) {
 
 // merge
 copyFolder(uiDist, rootDist);
+compressFolder(rootDist);
 copyFolder(pyDist, rootDist);
 
 fs.copyFileSync("install.sh", path.join(rootDist, "install.sh"));